@@ -1,53 +1,249 @@
 import dash
+import flask
 from dash import dcc, html, dash_table
 from dash.dependencies import Input, Output, State
-import plotly.express as px
+from dash.exceptions import PreventUpdate
 import pandas as pd
 import numpy as np
+import argparse
+import copy
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+try:
+    import fcntl
+except ImportError: # Windows: sem trava entre processos para publicar o snapshot
+    fcntl = None
 
 # Constantes para filtros "Todos"
 ALL_VALUES = "TODOS"
 
+# Arquivos CSV de origem do dataset
+PRODUTOS_CSV = 'Cadastro Produtos.csv'
+LOJAS_CSV = 'Cadastro Lojas.csv'
+CLIENTES_CSV = 'Cadastro Clientes.csv'
+CADASTRO_FILES = [PRODUTOS_CSV, LOJAS_CSV, CLIENTES_CSV]
+# Arquivos de vendas (um por ano) são descobertos pelo padrão do nome
+VENDAS_PATTERN = 'Base Vendas - *.csv'
+
+# Snapshot colunar do dataset unificado (string vazia desativa o cache em disco)
+SNAPSHOT_DIR = os.environ.get('DASH_SNAPSHOT_DIR', '.snapshot_dados')
+SNAPSHOT_FORMAT = 3
+# Modo compartilhado: cada worker mapeia o snapshot em memória (somente leitura) em vez
+# de carregar sua própria cópia, então o SO mantém uma única cópia residente dos dados
+SHARED_DATA = os.environ.get('DASH_SHARED_DATA', '0') == '1'
+# Intervalo (segundos) entre verificações de arquivos novos ou alterados; 0 desativa
+REFRESH_INTERVAL = float(os.environ.get('DASH_REFRESH_INTERVAL', '60'))
+
+
+def sales_files():
+    """Arquivos de vendas presentes no diretório, em ordem de nome."""
+    return sorted(glob.glob(VENDAS_PATTERN))
+
+
+def source_files():
+    """Todos os arquivos dos quais o dataset depende."""
+    return CADASTRO_FILES + sales_files()
+
+
+# --- Métricas (formato texto do Prometheus, servidas em /metrics) ---
+# Cada processo (worker) mantém e expõe as suas; o Prometheus agrega por instância.
+
+# Requisições de callback mais lentas que isto (ms) são registradas com o estado dos filtros; 0 desativa
+SLOW_REQUEST_MS = float(os.environ.get('DASH_SLOW_REQUEST_MS', '0'))
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (1_000, 5_000, 10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 5_000_000)
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in labels) + '}'
+
+
+class Counter:
+    """Contador monotônico com rótulos."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(zip(self.labelnames, key))} {value}")
+        return lines
+
+
+class Histogram:
+    """Histograma cumulativo com rótulos, como o prometheus_client.Histogram."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        position = int(np.searchsorted(self.buckets, value)) # Primeiro limite >= value
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, n) in sorted(self._series.items()):
+                labels = list(zip(self.labelnames, key))
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(float(bound))
+                    lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', le)])} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {total!r}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {n}")
+        return lines
+
+
+LOAD_STAGE_SECONDS = Histogram(
+    'dashboard_load_stage_seconds', "Duração de cada etapa da carga e da ingestão dos dados.", ['etapa'])
+CALLBACK_SECONDS = Histogram(
+    'dashboard_callback_seconds', "Duração da função de cada callback (com o cache de resultados).", ['callback'])
+CALLBACK_STAGE_SECONDS = Histogram(
+    'dashboard_callback_stage_seconds', "Duração de cada etapa das callbacks.", ['callback', 'etapa'])
+REQUEST_SECONDS = Histogram(
+    'dashboard_request_seconds', "Duração total das requisições de callback do Dash.", ['callback'])
+RESPONSE_BYTES = Histogram(
+    'dashboard_response_bytes', "Tamanho do JSON devolvido por requisição de callback.", ['callback'], SIZE_BUCKETS)
+SLOW_REQUESTS = Counter(
+    'dashboard_slow_requests_total', "Requisições de callback acima de DASH_SLOW_REQUEST_MS.", ['callback'])
+METRICS = [LOAD_STAGE_SECONDS, CALLBACK_SECONDS, CALLBACK_STAGE_SECONDS, REQUEST_SECONDS, RESPONSE_BYTES, SLOW_REQUESTS]
+
+# Rastro da requisição de callback em andamento nesta thread (ver instrumented e callback_stage)
+_trace = threading.local()
+
+
+def _current_trace():
+    trace = getattr(_trace, 'current', None)
+    if trace is None:
+        trace = _trace.current = {'callback': 'desconhecida', 'etapas': {}}
+    return trace
+
+
+@contextmanager
+def callback_stage(name):
+    """Acumula a duração de uma etapa (filtro, agregação, figuras...) da callback em andamento."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        etapas = _current_trace()['etapas']
+        etapas[name] = etapas.get(name, 0.0) + time.perf_counter() - start
+
+
+def instrumented(name):
+    """Decorator que mede a duração de uma callback e das etapas medidas dentro dela (callback_stage)."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args):
+            trace = _current_trace()
+            trace['callback'] = name
+            trace['etapas'] = {}
+            start = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                trace['duracao'] = time.perf_counter() - start
+                CALLBACK_SECONDS.observe(trace['duracao'], callback=name)
+                for stage, seconds in trace['etapas'].items():
+                    CALLBACK_STAGE_SECONDS.observe(seconds, callback=name, etapa=stage)
+        return wrapper
+    return decorator
+
+
 # Carregamento e pré-processamento dos dados
-def load_data():
+def load_lookups():
     """
-    Carrega todos os arquivos CSV, unifica os dados de vendas,
-    clientes e realiza os merges necessários.
-    """
-    try:
-        # Carregar arquivos de cadastro
-        df_produtos = pd.read_csv('Cadastro Produtos.csv', encoding='utf-8')
-        df_lojas = pd.read_csv('Cadastro Lojas.csv', encoding='utf-8')
-        df_clientes = pd.read_csv('Cadastro Clientes.csv', encoding='utf-8')
+    Carrega os cadastros usados para enriquecer as vendas.
 
-        # Carregar arquivos de vendas
-        df_vendas_2020 = pd.read_csv('Base Vendas - 2020.csv', encoding='utf-8')
-        df_vendas_2021 = pd.read_csv('Base Vendas - 2021.csv', encoding='utf-8')
-        df_vendas_2022 = pd.read_csv('Base Vendas - 2022.csv', encoding='utf-8')
-    except FileNotFoundError as e:
-        print(f"Erro: Arquivo não encontrado. Verifique se os CSVs estão no diretório correto. Detalhe: {e}")
-        return pd.DataFrame() # Retorna DataFrame vazio em caso de erro
+    Returns:
+        tuple: (df_clientes, df_produtos, df_lojas)
+    """
+    df_produtos = pd.read_csv(PRODUTOS_CSV, encoding='utf-8')
+    df_lojas = pd.read_csv(LOJAS_CSV, encoding='utf-8')
+    df_clientes = pd.read_csv(CLIENTES_CSV, encoding='utf-8')
 
     # Unificar colunas Nome e Sobrenome em Clientes
     df_clientes['Nome Completo'] = df_clientes['Primeiro Nome'] + ' ' + df_clientes['Sobrenome']
+    return df_clientes, df_produtos, df_lojas
 
-    # Unificar tabelas de vendas
-    df_vendas_total = pd.concat([df_vendas_2020, df_vendas_2021, df_vendas_2022], ignore_index=True)
+
+def enrich_sales(df_vendas, lookups):
+    """Converte datas, faz os merges com os cadastros e calcula a Receita de um lote de vendas."""
+    df_clientes, df_produtos, df_lojas = lookups
+    df_vendas = df_vendas.copy()
 
     # Converter 'Data da Venda' para datetime e extrair Ano e Mês-Ano
-    df_vendas_total['Data da Venda'] = pd.to_datetime(df_vendas_total['Data da Venda'], dayfirst=True, errors='coerce')
-    df_vendas_total['Ano da Venda'] = df_vendas_total['Data da Venda'].dt.year
-    df_vendas_total['MesAno da Venda'] = df_vendas_total['Data da Venda'].dt.to_period('M').astype(str)
+    with LOAD_STAGE_SECONDS.time(etapa='datas'):
+        df_vendas['Data da Venda'] = pd.to_datetime(df_vendas['Data da Venda'], dayfirst=True, errors='coerce')
+        df_vendas['Ano da Venda'] = df_vendas['Data da Venda'].dt.year
+        df_vendas['MesAno da Venda'] = df_vendas['Data da Venda'].dt.to_period('M').astype(str)
 
 
     # Merge das tabelas
-    # Vendas com Clientes
-    df_merged = pd.merge(df_vendas_total, df_clientes, on='ID Cliente', how='left')
-    # Vendas com Produtos
-    df_merged = pd.merge(df_merged, df_produtos, on='SKU', how='left')
-    # Vendas com Lojas
-    df_merged = pd.merge(df_merged, df_lojas, on='ID Loja', how='left')
+    with LOAD_STAGE_SECONDS.time(etapa='merge'):
+        # Vendas com Clientes
+        df_merged = pd.merge(df_vendas, df_clientes, on='ID Cliente', how='left')
+        # Vendas com Produtos
+        df_merged = pd.merge(df_merged, df_produtos, on='SKU', how='left')
+        # Vendas com Lojas
+        df_merged = pd.merge(df_merged, df_lojas, on='ID Loja', how='left')
+
+    return _clean_sales(df_merged)
 
+
+def _clean_sales(df_merged):
+    """Tipos numéricos, Receita e preenchimento de ausentes nas vendas já unidas aos cadastros."""
+    start = time.perf_counter()
     # Tratar possíveis NAs após o merge (especialmente se houver IDs não correspondentes)
     # Para colunas usadas em cálculos ou agrupamentos, preencher com valores neutros ou remover
     df_merged['Preço Unitario'] = pd.to_numeric(df_merged['Preço Unitario'], errors='coerce').fillna(0)
@@ -66,15 +262,1781 @@ def load_data():
             df_merged[col] = df_merged[col].fillna('Desconhecido')
         else:
             print(f"Aviso: Coluna {col} não encontrada no DataFrame final após merges.")
+
+    # Vendas em ordem cronológica (estável), base do filtro de período (ver TimeIndex)
+    if not df_merged['Data da Venda'].is_monotonic_increasing:
+        df_merged = df_merged.sort_values('Data da Venda', kind='stable', ignore_index=True)
+    LOAD_STAGE_SECONDS.observe(time.perf_counter() - start, etapa='tratamento')
+    return df_merged
+
+
+def sales_block_key(path, first_date):
+    """
+    Ordem dos blocos de vendas (um por arquivo) no dataset: pela primeira data e depois pelo nome.
+
+    Com arquivos que não se sobrepõem no tempo (um por ano), o dataset inteiro fica em ordem cronológica.
+    """
+    return (pd.Timestamp.max if pd.isna(first_date) else pd.Timestamp(first_date), path)
+
+
+def build_dataset(lookups=None):
+    """
+    Carrega todos os arquivos CSV, unifica os dados de vendas,
+    clientes e realiza os merges necessários.
+
+    As linhas ficam agrupadas por arquivo de vendas, cada bloco em ordem de data e os
+    blocos na ordem de sales_block_key(); df.attrs['arquivos_vendas'] guarda
+    [arquivo, número de linhas] de cada um.
+    """
+    try:
+        # Carregar arquivos de cadastro
+        with LOAD_STAGE_SECONDS.time(etapa='leitura_cadastros'):
+            lookups = lookups or load_lookups()
+
+        # Carregar arquivos de vendas
+        with LOAD_STAGE_SECONDS.time(etapa='leitura_vendas'):
+            vendas = {path: pd.read_csv(path, encoding='utf-8') for path in sales_files()}
+    except FileNotFoundError as e:
+        print(f"Erro: Arquivo não encontrado. Verifique se os CSVs estão no diretório correto. Detalhe: {e}")
+        return pd.DataFrame() # Retorna DataFrame vazio em caso de erro
+    if not vendas:
+        print(f"Erro: Nenhum arquivo de vendas ('{VENDAS_PATTERN}') encontrado.")
+        return pd.DataFrame()
+
+    # Unificar tabelas de vendas
+    chunks = {path: enrich_sales(df_vendas, lookups) for path, df_vendas in vendas.items()}
+    chunks = dict(sorted(chunks.items(), key=lambda item: sales_block_key(
+        item[0], item[1]['Data da Venda'].iloc[0] if len(item[1]) else None)))
+    df_merged = pd.concat(chunks.values(), ignore_index=True)
+    df_merged.attrs['arquivos_vendas'] = [[path, len(chunk)] for path, chunk in chunks.items()]
     return df_merged
 
-# Carregar os dados globalmente para serem usados nas callbacks
-df_global = load_data()
+
+# --- Snapshot colunar em disco ---
+# Layout: <SNAPSHOT_DIR>/manifest.json aponta para <SNAPSHOT_DIR>/<versao>/, que guarda
+# uma coluna por arquivo .npy. Colunas de texto são gravadas como códigos inteiros
+# (col_NNN.npy) mais o vetor ordenado de categorias (col_NNN_cats.npy), sem pickle.
+# Os códigos usam a mesma largura que o pd.Categorical usaria, para que o modo
+# compartilhado possa montar categóricas direto sobre o arquivo mapeado, sem cópia.
+# No modo compartilhado, <versao>/derivados/ guarda também os rollups do cubo e os
+# índices de busca (ver save_derived), mapeados do disco por todos os workers.
+
+DERIVED_DIR = 'derivados'
+# Nome dos diretórios de versão (ver _dataset_version); a limpeza só apaga o que segue este padrão
+VERSION_DIR_PATTERN = re.compile(r'[0-9a-f]{16}')
+
+def _codes_dtype(n_categories):
+    """Menor inteiro que o pandas usa para os códigos de uma categórica com n_categories."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categories < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _file_fingerprint(path, previous=None):
+    """Tamanho, mtime e sha256 de um arquivo; reaproveita o hash anterior se tamanho e mtime não mudaram."""
+    stat = os.stat(path)
+    if previous and previous.get('size') == stat.st_size and previous.get('mtime_ns') == stat.st_mtime_ns:
+        return dict(previous)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        # Em blocos (hashlib.file_digest só existe a partir do Python 3.11)
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+
+
+def source_fingerprints(previous=None):
+    """Retorna {arquivo: fingerprint} para os CSVs de origem, ou None se algum estiver ausente."""
+    previous = previous or {}
+    try:
+        return {path: _file_fingerprint(path, previous.get(path)) for path in source_files()}
+    except FileNotFoundError:
+        return None
+
+
+def _dataset_version(fingerprints):
+    """Identificador curto e determinístico do conteúdo dos arquivos de origem."""
+    h = hashlib.sha256(str(SNAPSHOT_FORMAT).encode())
+    for path in sorted(fingerprints):
+        h.update(f"{path}\0{fingerprints[path]['sha256']}\0".encode())
+    return h.hexdigest()[:16]
+
+
+def _write_json_atomic(path, payload):
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def _read_manifest(snapshot_dir):
+    try:
+        with open(os.path.join(snapshot_dir, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    return manifest if manifest.get('formato') == SNAPSHOT_FORMAT else None
+
+
+def _extend_snapshot_column(version_dir, entry, new_values, keep, order):
+    """Códigos e categorias de uma coluna de texto a partir dos gravados no snapshot anterior (ver extend_codes)."""
+    codes = np.load(os.path.join(version_dir, entry['arquivo']), mmap_mode='r', allow_pickle=False)
+    categories = np.load(os.path.join(version_dir, entry['categorias']), allow_pickle=False).astype(object)
+    return extend_codes(codes, pd.Index(categories), new_values.astype(object), keep, order)
+
+
+@contextmanager
+def snapshot_lock(snapshot_dir=SNAPSHOT_DIR):
+    """
+    Trava exclusiva entre processos (flock em <snapshot_dir>/.trava) para publicar uma versão.
+
+    Quem a obtém primeiro ingere e grava; os demais workers esperam e, ao entrar,
+    encontram a versão já publicada no manifest.
+    """
+    if not snapshot_dir or fcntl is None:
+        yield
+        return
+    os.makedirs(snapshot_dir, exist_ok=True)
+    with open(os.path.join(snapshot_dir, '.trava'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def save_snapshot(df, fingerprints, snapshot_dir=SNAPSHOT_DIR, delta=None):
+    """
+    Grava df em formato colunar e publica o manifest atomicamente.
+
+    Cada processo escreve num diretório temporário próprio e só então o renomeia
+    para <versao>, de modo que workers concorrentes nunca leem um snapshot parcial.
+
+    Args:
+        delta (tuple | None): (versão anterior, keep, added, order) quando df veio de
+            Dataset.ingest. Se o snapshot publicado for o da versão anterior, as colunas
+            de texto são estendidas a partir dos códigos gravados nele, codificando só
+            as linhas de added, em vez de refazer o factorize de todo o histórico.
+
+    Returns:
+        str: A versão do dataset gravada.
+    """
+    version = _dataset_version(fingerprints)
+    version_dir = os.path.join(snapshot_dir, version)
+    tmp_dir = f"{version_dir}.tmp-{os.getpid()}"
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    previous = {}
+    if delta is not None:
+        previous_version, keep, added, order = delta
+        manifest = _read_manifest(snapshot_dir)
+        if manifest is not None and manifest['versao'] == previous_version:
+            previous_dir = os.path.join(snapshot_dir, previous_version)
+            previous = {entry['nome']: entry for entry in manifest['colunas'] if entry['tipo'] == 'categorico'}
+
+    columns = []
+    for i, col in enumerate(df.columns):
+        values = df[col]
+        entry = {'nome': col, 'arquivo': f"col_{i:03d}.npy"}
+        if values.dtype.kind in 'biufcmM':
+            entry['tipo'] = 'numerico'
+            np.save(os.path.join(tmp_dir, entry['arquivo']), values.to_numpy(), allow_pickle=False)
+        else:
+            entry['tipo'] = 'categorico'
+            entry['categorias'] = f"col_{i:03d}_cats.npy"
+            if col in previous and col in added.columns:
+                codes, uniques = _extend_snapshot_column(previous_dir, previous[col], added[col], keep, order)
+            else:
+                codes, uniques = pd.factorize(values.astype(object), sort=True)
+            codes = codes.astype(_codes_dtype(len(uniques)))
+            np.save(os.path.join(tmp_dir, entry['arquivo']), codes, allow_pickle=False)
+            np.save(os.path.join(tmp_dir, entry['categorias']), np.asarray(uniques, dtype=str), allow_pickle=False)
+        columns.append(entry)
+
+    try:
+        os.rename(tmp_dir, version_dir)
+    except OSError:
+        # Outro processo já publicou esta mesma versão
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    _write_json_atomic(os.path.join(snapshot_dir, 'manifest.json'), {
+        'formato': SNAPSHOT_FORMAT,
+        'versao': version,
+        'linhas': len(df),
+        'fontes': fingerprints,
+        'arquivos_vendas': df.attrs.get('arquivos_vendas', []),
+        'colunas': columns,
+    })
+
+    _remove_old_versions(snapshot_dir, version)
+    return version
+
+
+def _writer_gone(name):
+    """Se name é um diretório temporário (<nome>.tmp-<pid>) de um processo que já terminou."""
+    prefix, _, pid = name.rpartition('.tmp-')
+    if not prefix or not pid.isdigit() or int(pid) == os.getpid() or os.name == 'nt':
+        return False # No Windows, os.kill encerraria o processo em vez de só testá-lo
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass # Existe, mas é de outro usuário
+    return False
+
+
+def _remove_old_versions(snapshot_dir, version):
+    """
+    Remove (melhor esforço) as versões anteriores à atual e os diretórios temporários
+    deixados por escritores que morreram no meio da gravação.
+
+    Só apaga diretórios com os nomes que save_snapshot e save_derived criam: o
+    snapshot_dir pode apontar para uma pasta com outros arquivos (ex.: DASH_SNAPSHOT_DIR=.).
+    """
+    for name in os.listdir(snapshot_dir):
+        path = os.path.join(snapshot_dir, name)
+        base = name.partition('.tmp-')[0]
+        if not VERSION_DIR_PATTERN.fullmatch(base) or not os.path.isdir(path):
+            continue
+        if (name == base and name != version) or (name != base and _writer_gone(name)):
+            shutil.rmtree(path, ignore_errors=True)
+    version_dir = os.path.join(snapshot_dir, version)
+    for name in os.listdir(version_dir) if os.path.isdir(version_dir) else []:
+        if name.partition('.tmp-')[0] == DERIVED_DIR and _writer_gone(name):
+            shutil.rmtree(os.path.join(version_dir, name), ignore_errors=True)
+
+
+def load_snapshot(manifest, snapshot_dir=SNAPSHOT_DIR, shared=False):
+    """
+    Reconstrói o DataFrame a partir do snapshot descrito em manifest.
+
+    Com shared=True as colunas são mapeadas do disco em modo somente leitura
+    (np.load com mmap_mode='r') e as de texto viram pd.Categorical sobre os
+    códigos mapeados: nenhum worker copia os dados, todos usam as mesmas
+    páginas do cache do SO.
+    """
+    version_dir = os.path.join(snapshot_dir, manifest['versao'])
+    mmap_mode = 'r' if shared else None
+    data = {}
+    for entry in manifest['colunas']:
+        values = np.load(os.path.join(version_dir, entry['arquivo']), mmap_mode=mmap_mode, allow_pickle=False)
+        if entry['tipo'] == 'categorico':
+            categories = np.load(os.path.join(version_dir, entry['categorias']), allow_pickle=False).astype(object)
+            codes = values
+            if shared:
+                values = pd.Categorical.from_codes(codes, categories=pd.Index(categories))
+            else:
+                values = categories.take(codes) if len(categories) else np.empty(len(codes), dtype=object)
+                values[codes < 0] = np.nan
+        data[entry['nome']] = values
+    df = pd.DataFrame(data, copy=False)
+    if len(df) != manifest['linhas']:
+        raise ValueError("Snapshot inconsistente com o manifest")
+    df.attrs['arquivos_vendas'] = manifest['arquivos_vendas']
+    if shared:
+        # Onde estão os arquivos mapeados; Dataset procura ali as estruturas derivadas
+        df.attrs['snapshot'] = version_dir
+    return df
+
+
+def _categories_digest(categories):
+    """Resumo dos valores de um pd.Index de categorias, para conferir estruturas gravadas contra o dataset."""
+    return hashlib.sha256('\0'.join(map(str, categories)).encode()).hexdigest()[:16]
+
+
+def save_derived(dataset, version_dir):
+    """
+    Grava em <version_dir>/derivados os rollups do cubo e os índices de busca de dataset.
+
+    Como o snapshot, é escrito num diretório temporário e renomeado: o primeiro worker
+    que publica vence e os demais passam a mapear os arquivos dele (load_derived).
+    Melhor esforço: uma falha só gera um aviso e o worker fica com as suas cópias.
+    """
+    target = os.path.join(version_dir, DERIVED_DIR)
+    if os.path.isdir(target):
+        return
+    tmp_dir = f"{target}.tmp-{os.getpid()}"
+    try:
+        os.makedirs(tmp_dir, exist_ok=True)
+        index = {
+            'formato': SNAPSHOT_FORMAT,
+            'versao': dataset.version,
+            'linhas': len(dataset.df),
+            'cubo': dataset.revenue_cube.save(tmp_dir),
+            'busca': {col: search_index.save(tmp_dir, f"busca_{i}")
+                      for i, (col, search_index) in enumerate(dataset.search_indexes.items())},
+        }
+        _write_json_atomic(os.path.join(tmp_dir, 'indice.json'), index)
+        os.rename(tmp_dir, target)
+    except OSError as e:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.isdir(target): # Senão, outro worker publicou primeiro
+            print(f"Aviso: Não foi possível gravar as estruturas derivadas em {target}. Detalhe: {e}")
+
+
+def load_derived(version_dir, df, filter_index):
+    """
+    Cubo e índices de busca gravados por save_derived para o snapshot de df, mapeados
+    do disco em modo somente leitura.
+
+    Returns:
+        tuple | None: (RevenueCube, {coluna: PrefixIndex}), ou None se não foram gravados
+        ou não conferem com df (aí o Dataset os constrói e grava).
+    """
+    directory = os.path.join(version_dir, DERIVED_DIR)
+    try:
+        with open(os.path.join(directory, 'indice.json'), encoding='utf-8') as f:
+            index = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if (index.get('formato') != SNAPSHOT_FORMAT or index.get('versao') != df.attrs.get('versao')
+            or index.get('linhas') != len(df)):
+        return None
+    try:
+        categories = dict(filter_index.categories)
+        categories[TIME_COLUMN] = encode_column(df[TIME_COLUMN])[1]
+        cube = RevenueCube.load(index['cubo'], directory, categories, mmap_mode='r')
+        search_indexes = {col: PrefixIndex.load(saved, directory, filter_index.categories.get(col, pd.Index([])),
+                                                mmap_mode='r')
+                          for col, saved in index['busca'].items()}
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Aviso: Estruturas derivadas em {directory} ilegíveis; reconstruindo. Detalhe: {e}")
+        return None
+    return cube, search_indexes
+
+
+def store_dataset(df, fingerprints, snapshot_dir=SNAPSHOT_DIR, shared=SHARED_DATA, delta=None):
+    """
+    Grava o snapshot de df (se habilitado) e marca df.attrs com a versão e as fontes.
+
+    No modo compartilhado devolve o DataFrame remapeado do snapshot recém-gravado,
+    descartando a cópia construída em memória, como os demais workers.
+
+    Com delta (ver save_snapshot) o snapshot é gravado a partir do anterior, e não é
+    regravado se outro worker já publicou esta versão.
+    """
+    version = _dataset_version(fingerprints)
+    if snapshot_dir:
+        try:
+            os.makedirs(snapshot_dir, exist_ok=True)
+            manifest = _read_manifest(snapshot_dir) if delta is not None else None
+            if manifest is None or manifest['versao'] != version:
+                with LOAD_STAGE_SECONDS.time(etapa='snapshot_gravacao'):
+                    save_snapshot(df, fingerprints, snapshot_dir, delta)
+            if shared:
+                df = load_snapshot(_read_manifest(snapshot_dir), snapshot_dir, shared=True)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Aviso: Não foi possível gravar o snapshot em {snapshot_dir}. Detalhe: {e}")
+    df.attrs['versao'] = version
+    df.attrs['fontes'] = fingerprints
+    return df
+
+
+def load_data(snapshot_dir=SNAPSHOT_DIR, force_rebuild=False, shared=SHARED_DATA):
+    """
+    Retorna o dataset unificado, usando o snapshot colunar em disco sempre que
+    os CSVs de origem (tamanho, mtime e sha256) não tiverem mudado.
+
+    Args:
+        snapshot_dir (str): Diretório do snapshot. Vazio desativa o cache.
+        force_rebuild (bool): Ignora o snapshot existente e o regrava a partir dos CSVs.
+        shared (bool): Mapeia o snapshot em memória em vez de copiá-lo (ver load_snapshot).
+
+    Returns:
+        pd.DataFrame: O dataset; df.attrs['versao'] identifica o conteúdo das fontes,
+        cujos fingerprints ficam em df.attrs['fontes'].
+    """
+    if not snapshot_dir and shared:
+        print("Aviso: DASH_SHARED_DATA requer o snapshot (DASH_SNAPSHOT_DIR); carregando sem compartilhar.")
+
+    manifest = None if force_rebuild or not snapshot_dir else _read_manifest(snapshot_dir)
+    with LOAD_STAGE_SECONDS.time(etapa='fingerprints'):
+        fingerprints = source_fingerprints(manifest['fontes'] if manifest else None)
+    if fingerprints is None:
+        return build_dataset() # Deixa build_dataset reportar o arquivo ausente
+
+    if manifest and _dataset_version(fingerprints) == manifest['versao']:
+        try:
+            with LOAD_STAGE_SECONDS.time(etapa='snapshot_leitura'):
+                df = load_snapshot(manifest, snapshot_dir, shared=shared)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Aviso: Snapshot em {snapshot_dir} ilegível, reconstruindo a partir dos CSVs. Detalhe: {e}")
+        else:
+            if fingerprints != manifest['fontes']:
+                # Só o mtime mudou (ex.: arquivo copiado de novo); evita refazer o hash na próxima carga
+                manifest['fontes'] = fingerprints
+                _write_json_atomic(os.path.join(snapshot_dir, 'manifest.json'), manifest)
+            df.attrs['versao'] = manifest['versao']
+            df.attrs['fontes'] = fingerprints
+            return df
+
+    df = build_dataset()
+    if df.empty:
+        return df
+    return store_dataset(df, fingerprints, snapshot_dir, shared)
+
+# --- Índice de filtros ---
+
+# Dimensões dos filtros globais, na ordem dos argumentos de apply_filters
+FILTER_COLUMNS = ['Produto', 'Nome da Loja', 'Nome Completo', 'Marca', 'Tipo do Produto']
+
+
+def encode_column(values):
+    """
+    Códigos inteiros de uma coluna, na ordem crescente dos valores, e o pd.Index dos valores.
+
+    Categóricas com categorias ordenadas (snapshot no modo compartilhado) reaproveitam
+    os próprios códigos, sem alocar um vetor novo por linha.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype) and values.cat.categories.is_monotonic_increasing:
+        return values.array.codes, values.cat.categories
+    codes, uniques = pd.factorize(values, sort=True)
+    return codes, pd.Index(uniques)
+
+
+def extend_encoding(codes, categories, new_values):
+    """
+    Acrescenta valores a uma coluna codificada por encode_column sem recodificar as linhas antigas.
+
+    Só new_values passa por hashing; se aparecerem valores inéditos, os códigos antigos
+    são remapeados com um take para manter a ordem alfabética dos códigos.
+
+    Returns:
+        tuple: (códigos antigos remapeados, códigos de new_values, novas categorias)
+    """
+    unseen = pd.Index(pd.unique(new_values.dropna())).difference(categories)
+    if len(unseen):
+        merged = categories.union(unseen)
+        remap = np.append(merged.get_indexer(categories), -1) # -1 (ausente) continua -1
+        codes = remap[codes]
+        categories = merged
+    return codes, categories.get_indexer(new_values), categories
+
+
+def extend_codes(codes, categories, new_values, keep=None, order=None):
+    """
+    Codificação de concat(<linhas antigas>.take(keep), new_values).take(order) a partir da
+    codificação das linhas antigas, com o mesmo resultado de um encode_column do zero.
+
+    Args:
+        keep (np.ndarray | None): Posições mantidas das linhas antigas (None = todas).
+        order (np.ndarray | None): Reordenação final das linhas (None = nenhuma).
+
+    Returns:
+        tuple: (códigos, categorias)
+    """
+    if keep is not None:
+        codes = codes[keep]
+    codes, new_codes, categories = extend_encoding(codes, categories, new_values)
+    codes = np.concatenate([codes, new_codes])
+    if keep is not None:
+        # Linhas saíram: descarta valores que não aparecem mais, como um encode_column do zero faria
+        observed = np.bincount(codes[codes >= 0], minlength=len(categories)) > 0
+        if not observed.all():
+            remap = np.full(len(observed) + 1, -1, dtype=np.intp)
+            remap[np.flatnonzero(observed)] = np.arange(observed.sum())
+            codes = remap[codes]
+            categories = categories[observed]
+    if order is not None:
+        codes = codes[order]
+    return codes, categories
+
+
+def normalize_selection(selected):
+    """
+    Converte o valor de um dropdown multi-seleção em lista de valores,
+    ou None quando o filtro não restringe nada (vazio, None ou contém ALL_VALUES).
+    """
+    if not selected:
+        return None
+    if not isinstance(selected, list):
+        selected = [selected]
+    if ALL_VALUES in selected:
+        return None
+    return selected
+
+
+def selection_mask(codes, categories, selections):
+    """
+    Máscara booleana das linhas cujos códigos pertencem às seleções.
+
+    Args:
+        codes (dict): {coluna: vetor de códigos inteiros por linha}.
+        categories (dict): {coluna: pd.Index com o valor de cada código}.
+        selections (dict): {coluna: lista de valores | None}; None não filtra.
+
+    Returns:
+        np.ndarray | None: A máscara, ou None se nenhum filtro estiver ativo.
+    """
+    mask = None
+    for col, selected in selections.items():
+        if selected is None or col not in codes:
+            continue
+        wanted = categories[col].get_indexer(selected)
+        # Última posição fica False para absorver o código -1 (valor ausente)
+        lookup = np.zeros(len(categories[col]) + 1, dtype=bool)
+        lookup[wanted[wanted >= 0]] = True
+        col_mask = lookup[codes[col]]
+        if mask is None:
+            mask = col_mask
+        else:
+            mask &= col_mask
+    return mask
+
+
+class FilterIndex:
+    """
+    Codifica as colunas de FILTER_COLUMNS como inteiros uma única vez por dataset,
+    para que os filtros virem lookups em vetores booleanos em vez de isin sobre strings.
+    """
+
+    def __init__(self, df, codes=None, categories=None):
+        self.df = df
+        self.n_rows = len(df)
+        if codes is not None:
+            self.codes, self.categories = codes, categories
+            return
+        self.codes = {}
+        self.categories = {}
+        for col in FILTER_COLUMNS:
+            if col in df.columns:
+                # A ordem dos códigos é a ordem alfabética dos valores
+                self.codes[col], self.categories[col] = encode_column(df[col])
+
+    def extend(self, df, keep, added, order=None):
+        """
+        FilterIndex de df = concat(self.df.take(keep), added).take(order), codificando só as linhas de added.
+
+        Args:
+            df (pd.DataFrame): O novo dataset.
+            keep (np.ndarray | None): Posições mantidas do dataset anterior (None = todas).
+            added (pd.DataFrame): Linhas acrescentadas ao final.
+            order (np.ndarray | None): Reordenação final das linhas (None = nenhuma).
+        """
+        codes, categories = {}, {}
+        for col, old_codes in self.codes.items():
+            codes[col], categories[col] = extend_codes(old_codes, self.categories[col], added[col], keep, order)
+        return FilterIndex(df, codes, categories)
+
+    def mask(self, selections):
+        """
+        Combina as seleções {coluna: lista de valores} numa única máscara booleana.
+
+        Returns:
+            np.ndarray | None: Máscara sobre as linhas do df, ou None se nenhum filtro estiver ativo.
+        """
+        return selection_mask(self.codes, self.categories, selections)
+
+    def positions(self, selections, rows=None):
+        """
+        Posições (np.intp) das linhas que passam nos filtros, ou None se todas passam.
+
+        Com rows (slice ou vetor de posições, ver TimeIndex.window) só essas linhas
+        são examinadas, e o resultado nunca é None.
+        """
+        if rows is None:
+            mask = self.mask(selections)
+            return None if mask is None else np.flatnonzero(mask)
+        codes = {col: self.codes[col][rows] for col, selected in selections.items()
+                 if selected is not None and col in self.codes}
+        mask = selection_mask(codes, self.categories, selections)
+        if isinstance(rows, slice):
+            return np.arange(rows.start, rows.stop) if mask is None else rows.start + np.flatnonzero(mask)
+        return np.sort(rows if mask is None else rows[mask])
+
+
+def filter_selections(selected_produtos, selected_lojas, selected_clientes, selected_marcas, selected_tipos_produto):
+    """Agrupa os valores dos dropdowns globais em {coluna: lista de valores | None}."""
+    values = [selected_produtos, selected_lojas, selected_clientes, selected_marcas, selected_tipos_produto]
+    return {col: normalize_selection(v) for col, v in zip(FILTER_COLUMNS, values)}
+
+
+# --- Filtro de período ---
+
+DATE_COLUMN = 'Data da Venda'
+
+
+def normalize_date_range(start_date, end_date, granularidade='dia'):
+    """
+    Converte as datas do DatePickerRange no período [início, fim) em datetime64[D].
+
+    Com granularidade 'mes' o período é estendido para meses inteiros, como os valores
+    de 'MesAno da Venda'. Uma data ausente deixa aquele lado do período aberto (None).
+
+    Returns:
+        tuple | None: (início, fim), ou None se nenhuma data foi escolhida.
+    """
+    if not start_date and not end_date:
+        return None
+    start = np.datetime64(str(start_date)[:10], 'D') if start_date else None
+    stop = np.datetime64(str(end_date)[:10], 'D') + 1 if end_date else None # fim inclusivo -> exclusivo
+    if granularidade == 'mes':
+        if start is not None:
+            start = start.astype('datetime64[M]').astype('datetime64[D]')
+        if stop is not None:
+            stop = ((stop - 1).astype('datetime64[M]') + 1).astype('datetime64[D]')
+    return start, stop
+
+
+class TimeIndex:
+    """
+    Busca binária por período sobre 'Data da Venda'.
+
+    O dataset fica em ordem de data (ver sales_block_key), então um período é uma
+    fatia contígua de linhas, achada com np.searchsorted, sem varrer o dataset. Se
+    arquivos de vendas se sobrepõem no tempo, guarda a permutação que ordena as
+    datas e o período vira um trecho dela.
+    """
+
+    def __init__(self, df):
+        if DATE_COLUMN in df.columns:
+            dates = df[DATE_COLUMN].to_numpy()
+        else:
+            dates = np.array([], dtype='datetime64[us]')
+        self.order = None
+        if len(dates) > 1 and not (dates[1:] >= dates[:-1]).all():
+            self.order = np.argsort(dates, kind='stable')
+            dates = dates[self.order]
+        self.dates = dates
+
+    def window(self, date_range):
+        """
+        Linhas do período [início, fim) de normalize_date_range.
+
+        Returns:
+            tuple: (linhas, datas) — linhas é um slice (dataset em ordem) ou um vetor de
+            posições; datas são as datas dessas linhas, na mesma ordem.
+        """
+        start, stop = date_range
+        lo = 0 if start is None else int(np.searchsorted(self.dates, start.astype(self.dates.dtype)))
+        hi = len(self.dates) if stop is None else int(np.searchsorted(self.dates, stop.astype(self.dates.dtype)))
+        hi = max(lo, hi)
+        rows = slice(lo, hi) if self.order is None else self.order[lo:hi]
+        return rows, self.dates[lo:hi]
+
+
+# --- Cubo de receita pré-agregado ---
+
+TIME_COLUMN = 'MesAno da Venda'
+CUBE_MEASURES = ['Receita', 'Qtd Vendida']
+# Dimensões derivadas de outra dimensão do cubo
+CUBE_DERIVED = {'Ano da Venda': TIME_COLUMN}
+# Contagem de vendas por grupo, mantida só para saber quando um grupo esvazia na ingestão incremental
+CUBE_ROW_COUNT = '_linhas'
+_PRODUCT_DIMS = ('Produto', 'Marca', 'Tipo do Produto')
+# Rollups materializados. Produto, Marca e Tipo vêm do mesmo cadastro (SKU) e
+# andam sempre juntos, então não aumentam a cardinalidade dos rollups.
+CUBE_ROLLUPS = [
+    (TIME_COLUMN,) + _PRODUCT_DIMS + ('Nome da Loja', 'Nome Completo'),
+    (TIME_COLUMN,) + _PRODUCT_DIMS + ('Nome da Loja',),
+    (TIME_COLUMN,) + _PRODUCT_DIMS,
+    (TIME_COLUMN, 'Nome da Loja'),
+    ('Nome Completo',),
+]
+
+
+def top_k(values, k):
+    """
+    Posições dos k maiores valores, em ordem decrescente, via seleção parcial.
+
+    Empates são resolvidos pela menor posição, como Series.nlargest(keep='first').
+    """
+    if k >= len(values):
+        return np.argsort(-values, kind='stable')
+    kth = np.partition(values, len(values) - k)[len(values) - k]
+    above = np.flatnonzero(values > kth)
+    ties = np.flatnonzero(values == kth)[:k - len(above)]
+    chosen = np.sort(np.concatenate([above, ties]))
+    return chosen[np.argsort(-values[chosen], kind='stable')]
+
+
+class RevenueCube:
+    """
+    Somas de CUBE_MEASURES pré-agregadas por combinação de dimensões (ver CUBE_ROLLUPS).
+
+    Cada consulta usa o menor rollup que contém as dimensões pedidas mais as
+    filtradas, então o custo cresce com o número de combinações distintas e
+    não com o número de vendas.
+    """
+
+    def __init__(self, df, index):
+        self.categories = dict(index.categories)
+        codes = dict(index.codes)
+        month_codes, months = encode_column(df[TIME_COLUMN])
+        codes[TIME_COLUMN] = month_codes
+        self.categories[TIME_COLUMN] = months
+        month_year = np.zeros(len(months), dtype=df['Ano da Venda'].dtype)
+        month_year[month_codes] = df['Ano da Venda'].to_numpy()
+        self.years = np.unique(month_year)
+        self.month_year_code = np.searchsorted(self.years, month_year)
+        self.measure_dtypes = {measure: df[measure].dtype for measure in CUBE_MEASURES}
+        self._set_month_starts()
+
+        base = pd.DataFrame({col: codes[col] for col in CUBE_ROLLUPS[0]})
+        for measure in CUBE_MEASURES:
+            base[measure] = df[measure].to_numpy()
+        base[CUBE_ROW_COUNT] = 1
+        self.rollups = self._sorted_rollups([self._rollup(dims, [base]) for dims in CUBE_ROLLUPS])
+
+    def _set_month_starts(self):
+        # 'AAAA-MM' em ordem alfabética é a ordem cronológica, então os códigos de mês também são
+        self.month_starts = np.asarray(self.categories[TIME_COLUMN], dtype='datetime64[M]')
+
+    def month_codes(self, dates):
+        """Código de TIME_COLUMN de cada data (datetime64)."""
+        return np.searchsorted(self.month_starts, dates.astype('datetime64[M]'))
+
+    def month_range(self, date_range):
+        """
+        Faixa [primeiro, último + 1) de códigos de mês equivalente ao período [início, fim),
+        ou None se o período não é formado por meses inteiros.
+        """
+        bounds = []
+        for day, default in zip(date_range, (0, len(self.month_starts))):
+            if day is None:
+                bounds.append(default)
+                continue
+            month = day.astype('datetime64[M]')
+            if month.astype('datetime64[D]') != day:
+                return None
+            bounds.append(int(np.searchsorted(self.month_starts, month)))
+        return bounds[0], max(bounds)
+
+    @staticmethod
+    def _rollup(dims, parts):
+        """Agrega (e soma entre si) as partes por dims, descartando grupos que ficaram sem linhas."""
+        dims = list(dims)
+        sums = CUBE_MEASURES + [CUBE_ROW_COUNT]
+        frame = pd.concat([part[dims + sums] for part in parts], ignore_index=True) if len(parts) > 1 else parts[0]
+        frame = frame.groupby(dims, sort=False)[sums].sum().reset_index()
+        if len(parts) > 1:
+            frame = frame[frame[CUBE_ROW_COUNT] > 0]
+        if TIME_COLUMN in dims:
+            # Em ordem de mês: um período de meses inteiros é uma fatia do rollup (ver aggregate_many)
+            frame = frame.sort_values(TIME_COLUMN, kind='stable')
+        return frozenset(dims), {col: frame[col].to_numpy() for col in dims + sums}
+
+    @staticmethod
+    def _sorted_rollups(rollups):
+        return sorted(rollups, key=lambda item: len(item[1][CUBE_ROW_COUNT]))
+
+    def save(self, directory):
+        """Grava os rollups em directory, um .npy por coluna; devolve a descrição usada por RevenueCube.load."""
+        rollups = []
+        for i, (dims, columns) in enumerate(self.rollups):
+            files = {}
+            for j, (col, values) in enumerate(columns.items()):
+                files[col] = f"rollup_{i}_{j:02d}.npy"
+                np.save(os.path.join(directory, files[col]), values, allow_pickle=False)
+            rollups.append({'dimensoes': sorted(dims), 'colunas': files})
+        return {
+            'categorias': {col: _categories_digest(values) for col, values in self.categories.items()},
+            'anos': self.years.tolist(),
+            'tipo_anos': self.years.dtype.str,
+            'mes_ano': self.month_year_code.tolist(),
+            'medidas': {measure: dtype.str for measure, dtype in self.measure_dtypes.items()},
+            'rollups': rollups,
+        }
+
+    @classmethod
+    def load(cls, saved, directory, categories, mmap_mode=None):
+        """
+        Cubo gravado por save, com os rollups lidos de directory (mapeados, com mmap_mode='r').
+
+        categories são as categorias do dataset atual (as do FilterIndex mais TIME_COLUMN);
+        levanta ValueError se não forem as mesmas da gravação.
+        """
+        if {col: _categories_digest(values) for col, values in categories.items()} != saved['categorias']:
+            raise ValueError("Categorias do cubo gravado não conferem com o dataset")
+        cube = cls.__new__(cls)
+        cube.categories = dict(categories)
+        cube.years = np.asarray(saved['anos'], dtype=saved['tipo_anos'])
+        cube.month_year_code = np.asarray(saved['mes_ano'], dtype=np.intp)
+        cube.measure_dtypes = {measure: np.dtype(dtype) for measure, dtype in saved['medidas'].items()}
+        cube._set_month_starts()
+        cube.rollups = [(frozenset(entry['dimensoes']),
+                         {col: np.load(os.path.join(directory, name), mmap_mode=mmap_mode, allow_pickle=False)
+                          for col, name in entry['colunas'].items()})
+                        for entry in saved['rollups']]
+        return cube
+
+    def extend(self, index, added, removed=None):
+        """
+        Cubo do dataset com as linhas added acrescentadas e as removed retiradas.
+
+        Os rollups existentes só têm os códigos remapeados para as novas categorias de
+        index; as linhas alteradas entram como um delta (medidas e contagem com sinal),
+        então o custo é proporcional ao tamanho dos rollups mais o do delta.
+        """
+        cube = copy.copy(self)
+        cube.categories = dict(index.categories)
+        old_months = self.categories[TIME_COLUMN]
+        cube.categories[TIME_COLUMN] = old_months.union(pd.Index(pd.unique(added[TIME_COLUMN].dropna())))
+
+        month_year = np.zeros(len(cube.categories[TIME_COLUMN]), dtype=self.years.dtype)
+        month_year[cube.categories[TIME_COLUMN].get_indexer(old_months)] = self.years[self.month_year_code]
+        month_year[cube.categories[TIME_COLUMN].get_indexer(added[TIME_COLUMN])] = added['Ano da Venda'].to_numpy()
+        cube.years = np.unique(month_year)
+        cube.month_year_code = np.searchsorted(cube.years, month_year)
+        cube._set_month_starts()
+
+        remaps = {}
+        for col in CUBE_ROLLUPS[0]:
+            if not self.categories[col].equals(cube.categories[col]):
+                remaps[col] = np.append(cube.categories[col].get_indexer(self.categories[col]), -1)
+        old_parts = []
+        for _, columns in self.rollups:
+            old_parts.append(pd.DataFrame({col: remaps[col][values] if col in remaps else values
+                                           for col, values in columns.items()}))
+
+        delta = []
+        for rows, sign in ((added, 1), (removed, -1)):
+            if rows is None or rows.empty:
+                continue
+            part = pd.DataFrame({col: cube.categories[col].get_indexer(rows[col]) for col in CUBE_ROLLUPS[0]})
+            for measure in CUBE_MEASURES:
+                part[measure] = sign * rows[measure].to_numpy()
+            part[CUBE_ROW_COUNT] = sign
+            delta.append(part)
+
+        cube.rollups = self._sorted_rollups([self._rollup(dims, [old] + delta)
+                                             for (dims, _), old in zip(self.rollups, old_parts)])
+        if removed is not None and not removed.empty:
+            cube._drop_unobserved_months()
+        return cube
+
+    def _drop_unobserved_months(self):
+        """Descarta os meses que ficaram sem vendas, como um cubo construído do zero faria."""
+        months = self.rollup_for(CUBE_ROLLUPS[0])[TIME_COLUMN]
+        observed = np.bincount(months, minlength=len(self.categories[TIME_COLUMN])) > 0
+        if observed.all():
+            return
+        remap = np.full(len(observed), -1, dtype=np.intp)
+        remap[np.flatnonzero(observed)] = np.arange(observed.sum())
+        self.rollups = [(dims, {col: remap[values] if col == TIME_COLUMN else values for col, values in columns.items()})
+                        for dims, columns in self.rollups]
+        self.categories[TIME_COLUMN] = self.categories[TIME_COLUMN][observed]
+        month_year = self.years[self.month_year_code[observed]]
+        self.years = np.unique(month_year)
+        self.month_year_code = np.searchsorted(self.years, month_year)
+        self._set_month_starts()
+
+    def rollup_for(self, dims):
+        """Menor rollup (dict coluna -> vetor) cujas dimensões contêm dims."""
+        dims = {CUBE_DERIVED.get(dim, dim) for dim in dims}
+        for rollup_dims, columns in self.rollups:
+            if dims <= rollup_dims:
+                return columns
+        raise KeyError(f"Nenhum rollup cobre as dimensões {sorted(dims)}")
+
+    def _group_codes(self, columns, col):
+        """Códigos da dimensão col nas linhas do rollup e o número de códigos possíveis."""
+        if col == 'Ano da Venda':
+            return self.month_year_code[columns[TIME_COLUMN]], len(self.years)
+        return columns[col], len(self.categories[col])
+
+    def _group_labels(self, col, codes):
+        if col == 'Ano da Venda':
+            return pd.Index(self.years[codes], name=col)
+        return self.categories[col].take(codes).rename(col)
+
+    def aggregate_many(self, requests, selections, months=None):
+        """
+        Calcula vários agrupamentos de uma vez.
+
+        Os pedidos atendidos pelo mesmo rollup compartilham uma única máscara de
+        filtro, e cada soma é um np.bincount sobre os códigos inteiros já guardados
+        no cubo, sem groupby nem fatorização por chamada.
+
+        Args:
+            requests (list): Tuplas (nome, colunas de agrupamento, k). Com k, só as
+                k maiores receitas são devolvidas, em ordem decrescente; sem k
+                (None), todos os grupos em ordem crescente das chaves.
+            selections (dict): Seleções no formato de filter_selections().
+            months (tuple | None): Faixa [primeiro, último + 1) de códigos de mês
+                (ver month_range); os rollups, em ordem de mês, são fatiados por busca binária.
+
+        Returns:
+            dict: {nome: pd.DataFrame com CUBE_MEASURES indexado pelas chaves}.
+        """
+        active = {col: selected for col, selected in selections.items() if selected is not None}
+        required = set(active) | ({TIME_COLUMN} if months is not None else set())
+        plans = {}
+        for name, by, k in requests:
+            columns = self.rollup_for(set(by) | required)
+            plans.setdefault(id(columns), (columns, []))[1].append((name, by, k))
+
+        results = {}
+        for columns, items in plans.values():
+            if months is not None:
+                lo, hi = np.searchsorted(columns[TIME_COLUMN], months)
+                columns = {col: values[lo:hi] for col, values in columns.items()}
+            results.update(self.aggregate_rows(items, active, columns))
+        return results
+
+    def aggregate_rows(self, requests, selections, columns):
+        """
+        Como aggregate_many, mas sobre as linhas em columns ({coluna: vetor} com os
+        códigos das dimensões e as medidas), ex.: as vendas de um período (Dataset.window_columns).
+        """
+        with callback_stage('filtro'):
+            mask = selection_mask(columns, self.categories, selections)
+            if mask is not None:
+                positions = np.flatnonzero(mask)
+                columns = {col: values[positions] for col, values in columns.items()}
+        with callback_stage('agregacao'):
+            return self._aggregate_items(columns, requests)
+
+    def _aggregate_items(self, columns, items):
+        """Somas de cada pedido (nome, by, k) sobre as linhas (já filtradas) de um rollup."""
+        results = {}
+        for name, by, k in items:
+            group_codes, sizes = zip(*(self._group_codes(columns, col) for col in by))
+            key = group_codes[0] if len(by) == 1 else np.ravel_multi_index(group_codes, sizes)
+            n_keys = int(np.prod(sizes))
+            keys = None
+            if n_keys > len(key):
+                # Espaço de chaves maior que o número de linhas (ex.: dimensões que andam juntas,
+                # como Tipo/Marca/Produto): compacta as chaves presentes, para que memória e tempo
+                # acompanhem as linhas do rollup e não o produto das cardinalidades
+                keys, key = np.unique(key, return_inverse=True)
+                n_keys = len(keys)
+            present = np.flatnonzero(np.bincount(key, minlength=n_keys))
+            sums = {}
+            for measure in CUBE_MEASURES:
+                total = np.bincount(key, weights=columns[measure], minlength=n_keys)[present]
+                if self.measure_dtypes[measure].kind in 'iu':
+                    total = np.rint(total).astype(self.measure_dtypes[measure])
+                else:
+                    # bincount soma sem compensação (o groupby usa Kahan); arredondar abaixo
+                    # do centavo elimina o ruído da última casa e preserva empates reais
+                    total = total.round(6)
+                sums[measure] = total
+            if keys is not None:
+                present = keys[present]
+            if k is not None:
+                order = top_k(sums['Receita'], k)
+                present = present[order]
+                sums = {measure: total[order] for measure, total in sums.items()}
+            level_codes = np.unravel_index(present, sizes) if len(by) > 1 else (present,)
+            levels = [self._group_labels(col, codes) for col, codes in zip(by, level_codes)]
+            index = levels[0] if len(by) == 1 else pd.MultiIndex.from_arrays(levels)
+            results[name] = pd.DataFrame(sums, index=index)
+        return results
+
+    def aggregate(self, by, selections):
+        """Equivalente a apply_filters(...).groupby(by)[CUBE_MEASURES].sum()."""
+        return self.aggregate_many([('resultado', by, None)], selections)['resultado']
+
+
+# --- Hierarquia Tipo -> Marca -> Produto (seção em cascata) ---
+
+class ProductHierarchy:
+    """
+    Respostas da seção em cascata, calculadas uma vez a partir do cubo: as opções de
+    Marca de cada Tipo e a receita por Produto, já ordenada, de cada par (Tipo, Marca).
+
+    Depende só do catálogo de produtos vendidos e dos totais por produto, então as
+    callbacks viram consultas a dicionários, independentes do número de vendas.
+    """
+
+    def __init__(self, cube):
+        # As chaves (Tipo, Marca, Produto) são compactadas no kernel do cubo: o custo acompanha os
+        # produtos vendidos, não o produto das cardinalidades. Um mesmo nome de Produto pode aparecer
+        # em mais de uma Marca no cadastro, por isso o agrupamento é pela tripla e não só por Produto.
+        totals = cube.aggregate(['Tipo do Produto', 'Marca', 'Produto'], {})['Receita']
+        # O cubo devolve os grupos em ordem crescente de Tipo, Marca e Produto: cada par (Tipo, Marca)
+        # é uma faixa contígua, reordenada por receita decrescente com um único lexsort
+        tipo_codes, marca_codes, _ = totals.index.codes
+        starts = np.flatnonzero((np.diff(tipo_codes, prepend=-1) != 0) | (np.diff(marca_codes, prepend=-1) != 0))
+        bounds = np.append(starts, len(totals))
+        pair = np.repeat(np.arange(len(starts)), np.diff(bounds))
+        receita = totals.to_numpy()
+        order = np.lexsort((-receita, pair))
+        self.products = totals.index.get_level_values('Produto').take(order)
+        self.revenue = receita[order]
+        self.brand_options = {}
+        self.product_ranges = {}
+        tipos = totals.index.levels[0].take(tipo_codes[starts]).tolist()
+        marcas = totals.index.levels[1].take(marca_codes[starts]).tolist()
+        for tipo, marca, start, stop in zip(tipos, marcas, bounds[:-1].tolist(), bounds[1:].tolist()):
+            self.product_ranges[(tipo, marca)] = (start, stop)
+            self.brand_options.setdefault(tipo, []).append({'label': str(marca), 'value': str(marca)})
+
+    def brands(self, tipo):
+        """Opções do dropdown de Marca para o Tipo (sem a opção 'ALL')."""
+        return self.brand_options.get(tipo, [])
+
+    def revenue_by_product(self, tipo, marca):
+        """DataFrame Produto/Receita em ordem decrescente de receita, ou None se o par não tem vendas."""
+        found = self.product_ranges.get((tipo, marca))
+        if found is None:
+            return None
+        start, stop = found
+        return pd.DataFrame({'Produto': self.products[start:stop], 'Receita': self.revenue[start:stop]})
+
+
+# --- Figuras enxutas ---
+# As figuras são dicts montados direto dos vetores agregados, sem Plotly Express. O esqueleto
+# (layout fixo e propriedades dos traços) vai ao navegador uma vez por versão dos dados; depois,
+# enquanto só os filtros mudam, as respostas trocam apenas os vetores dos traços (dash.Patch).
+# Do template 'plotly' ficam só as propriedades que definem a aparência dos gráficos, em vez
+# dos ~7 KB que o Plotly Express embute em cada figura.
+
+REVENUE_LABEL = 'Receita Total (R$)'
+_AXIS_STYLE = {'gridcolor': 'white', 'linecolor': 'white', 'zerolinecolor': 'white', 'zerolinewidth': 2,
+               'automargin': True, 'ticks': ''}
+BASE_LAYOUT = {
+    'colorway': ['#636efa', '#EF553B', '#00cc96', '#ab63fa', '#FFA15A',
+                 '#19d3f3', '#FF6692', '#B6E880', '#FF97FF', '#FECB52'],
+    'font': {'color': '#2a3f5f'},
+    'paper_bgcolor': 'white',
+    'plot_bgcolor': '#E5ECF6',
+    'hovermode': 'closest',
+    'hoverlabel': {'align': 'left'},
+    'margin': {'t': 60},
+}
+
+
+def figure_layout(xaxis, yaxis, **layout):
+    """BASE_LAYOUT com os eixos (títulos e ajustes) e demais propriedades de uma figura."""
+    result = copy.deepcopy(BASE_LAYOUT)
+    result['xaxis'] = dict(_AXIS_STYLE, **xaxis)
+    result['yaxis'] = dict(_AXIS_STYLE, **yaxis)
+    result.update(layout)
+    return result
+
+
+def category_figure(category_label, value_label, horizontal=False, trace=None, category_axis=None, **layout):
+    """
+    Esqueleto de figura com um traço de valores por categoria (barras, por padrão).
+
+    Os vetores x/y ficam de fora; vêm de category_trace e entram com fill_figure ou patch_figure.
+    """
+    cat, val = ('y', 'x') if horizontal else ('x', 'y')
+    trace = dict({'type': 'bar'}, **(trace or {}))
+    trace['hovertemplate'] = f"{category_label}=%{{{cat}}}<br>{value_label}=%{{{val}}}<extra></extra>"
+    if horizontal:
+        trace['orientation'] = 'h'
+    axes = {cat + 'axis': dict({'title': {'text': category_label}}, **(category_axis or {})),
+            val + 'axis': {'title': {'text': value_label}}}
+    return {'data': [trace], 'layout': figure_layout(**axes, **layout)}
+
+
+def category_trace(categories, values, horizontal=False):
+    """Vetores x/y do traço de category_figure."""
+    categories, values = np.asarray(categories).tolist(), np.asarray(values).tolist()
+    return {'x': values, 'y': categories} if horizontal else {'x': categories, 'y': values}
+
+
+def stacked_area_figure(series_names, x_label, y_label, legend_title):
+    """
+    Esqueleto de áreas empilhadas com um traço fixo por série, na ordem de series_names.
+
+    Como os traços não dependem dos filtros, cada série mantém a cor e a posição na
+    legenda, e uma atualização parcial só precisa trocar os vetores.
+    """
+    traces = [{'type': 'scatter', 'mode': 'lines', 'stackgroup': '1', 'name': name, 'legendgroup': name,
+               'hovertemplate': f"{legend_title}={name}<br>{x_label}=%{{x}}<br>{y_label}=%{{y}}<extra></extra>"}
+              for name in series_names]
+    return {'data': traces, 'layout': figure_layout({'title': {'text': x_label}, 'tickangle': 45},
+                                                    {'title': {'text': y_label}},
+                                                    legend={'title': {'text': legend_title}})}
+
+
+def stacked_area_traces(values, series_names):
+    """
+    Vetores dos traços de stacked_area_figure a partir de uma Series indexada por (x, série).
+
+    Séries sem valores ficam vazias e fora da legenda.
+    """
+    x = values.index.get_level_values(0).to_numpy()
+    series = values.index.get_level_values(1).to_numpy()
+    order = np.argsort(x, kind='stable')
+    x, series, y = x[order], series[order], values.to_numpy()[order]
+    traces = []
+    for name in series_names:
+        rows = series == name
+        traces.append({'x': x[rows].tolist(), 'y': y[rows].tolist(), 'showlegend': bool(rows.any())})
+    return traces
+
+
+def fill_figure(skeleton, traces):
+    """Figura completa: o esqueleto com os vetores de cada traço."""
+    return {'data': [dict(trace, **arrays) for trace, arrays in zip(skeleton['data'], traces)],
+            'layout': skeleton['layout']}
+
+
+def patch_figure(traces):
+    """dash.Patch que troca só os vetores dos traços de uma figura já desenhada com o mesmo esqueleto."""
+    patch = dash.Patch()
+    for i, arrays in enumerate(traces):
+        for prop, value in arrays.items():
+            patch['data'][i][prop] = value
+    return patch
+
+
+# Gráficos de barras/linha de update_main_graphs, na ordem dos Outputs:
+# (agregação, rótulo da categoria, barras horizontais, argumentos de category_figure)
+MAIN_FIGURES = [
+    ('receita_ano', 'Ano', False,
+     {'trace': {'type': 'scatter', 'mode': 'lines+markers'}, 'category_axis': {'type': 'category'}}),
+    ('top_clientes', 'Cliente', True, {'category_axis': {'categoryorder': 'total ascending'}}),
+    ('top_produtos', 'Produto', False, {'category_axis': {'categoryorder': 'total descending'}}),
+    ('top_lojas', 'Loja', True, {'category_axis': {'categoryorder': 'total ascending'},
+                                 'title': {'text': 'Top 15 Lojas por Receita'}}),
+]
+
+
+def main_figure_skeletons(product_types):
+    """Esqueletos dos cinco gráficos principais; o último tem um traço por Tipo do Produto."""
+    skeletons = [category_figure(label, REVENUE_LABEL, horizontal, **kwargs)
+                 for _, label, horizontal, kwargs in MAIN_FIGURES]
+    skeletons.append(stacked_area_figure(product_types, 'Mês-Ano', 'Receita (R$)', 'Tipo de Produto'))
+    return skeletons
+
+
+def main_figure_traces(aggregates, product_types):
+    """Vetores dos traços de main_figure_skeletons a partir das agregações de MAIN_AGGREGATIONS."""
+    traces = []
+    for name, _, horizontal, _ in MAIN_FIGURES:
+        receita = aggregates[name]['Receita']
+        traces.append([category_trace(receita.index, receita.to_numpy(), horizontal)])
+    traces.append(stacked_area_traces(aggregates['receita_tipo_tempo']['Receita'], product_types))
+    return traces
+
+
+# --- Busca nos dropdowns ---
+
+# Dropdowns com opções carregadas sob demanda (busca no servidor) e a coluna de cada um
+SEARCHABLE_DROPDOWNS = {'dropdown-produto': 'Produto', 'dropdown-cliente': 'Nome Completo'}
+# Número máximo de sugestões devolvidas por busca
+SEARCH_LIMIT = 50
+
+
+def fold_text(text):
+    """Remove acentos e caixa para comparar textos digitados com os cadastros."""
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+class PrefixIndex:
+    """
+    Índice ordenado para busca por prefixo de qualquer palavra dos valores de uma coluna
+    (ex.: "manh" encontra "ANTONIO MANHÃES"), ignorando acentos e caixa.
+    """
+
+    def __init__(self, values, keys=None, owners=None):
+        self.values = pd.Index(values)
+        if keys is not None:
+            self.keys, self.owners = keys, owners
+            return
+        keys, owners = [], []
+        for i, value in enumerate(self.values):
+            folded = fold_text(value)
+            for pos, char in enumerate(folded):
+                if not char.isspace() and (pos == 0 or folded[pos - 1].isspace()):
+                    keys.append(folded[pos:])
+                    owners.append(i)
+        keys = np.array(keys, dtype=str)
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.owners = np.array(owners, dtype=np.intp)[order]
+
+    def save(self, directory, name):
+        """Grava as chaves e os donos em directory; devolve a descrição usada por PrefixIndex.load."""
+        files = {'chaves': f"{name}_chaves.npy", 'donos': f"{name}_donos.npy"}
+        np.save(os.path.join(directory, files['chaves']), self.keys, allow_pickle=False)
+        np.save(os.path.join(directory, files['donos']), self.owners, allow_pickle=False)
+        return dict(files, categorias=_categories_digest(self.values))
+
+    @classmethod
+    def load(cls, saved, directory, values, mmap_mode=None):
+        """Índice gravado por save para values; ValueError se values não são os mesmos da gravação."""
+        if _categories_digest(values) != saved['categorias']:
+            raise ValueError("Valores do índice de busca gravado não conferem com o dataset")
+        load = lambda key: np.load(os.path.join(directory, saved[key]), mmap_mode=mmap_mode, allow_pickle=False)
+        return cls(values, load('chaves'), load('donos'))
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Os primeiros limit valores, em ordem alfabética, com alguma palavra começando por query."""
+        query = fold_text(query).strip()
+        if not query:
+            return []
+        lo = np.searchsorted(self.keys, query, side='left')
+        hi = np.searchsorted(self.keys, query + '\U0010ffff', side='left')
+        # As chaves estão em ordem de palavra, não de valor: junta todos os donos antes de cortar
+        # (values está ordenado, então a ordem dos donos é a alfabética)
+        return list(self.values.take(np.unique(self.owners[lo:hi])[:limit]))
+
+
+# --- Carregamento dos dados em segundo plano ---
+
+class Dataset:
+    """
+    O DataFrame carregado e as estruturas derivadas dele. Não é alterado depois de
+    construído: cada callback lê current_dataset() uma vez e trabalha só com ele,
+    e uma versão nova dos dados é publicada como outro Dataset (ver refresh_dataset).
+    """
+
+    def __init__(self, df, filter_index=None, revenue_cube=None, lookups=None, previous=None):
+        self.df = df
+        self.version = df.attrs.get('versao', '')
+        self.sources = df.attrs.get('fontes', {})
+        # (arquivo, linhas) na ordem em que as vendas de cada arquivo aparecem em df
+        self.sales_rows = [tuple(item) for item in df.attrs.get('arquivos_vendas', [])]
+        if filter_index is None:
+            with LOAD_STAGE_SECONDS.time(etapa='indices'):
+                filter_index = FilterIndex(df)
+        # Modo compartilhado: cubo e índices de busca já gravados junto do snapshot são mapeados do
+        # disco, em vez de cada worker construir (e manter) a sua cópia
+        snapshot = df.attrs.get('snapshot')
+        derived = None
+        if snapshot and not df.empty:
+            with LOAD_STAGE_SECONDS.time(etapa='derivados_leitura'):
+                derived = load_derived(snapshot, df, filter_index)
+        if derived is not None:
+            revenue_cube = derived[0]
+        if revenue_cube is None and not df.empty:
+            with LOAD_STAGE_SECONDS.time(etapa='cubo'):
+                revenue_cube = RevenueCube(df, filter_index)
+        self.filter_index = filter_index
+        self.revenue_cube = revenue_cube
+        self.time_index = TimeIndex(df)
+        self.hierarchy = None
+        if revenue_cube is not None:
+            with LOAD_STAGE_SECONDS.time(etapa='hierarquia'):
+                self.hierarchy = ProductHierarchy(revenue_cube)
+        self.search_indexes = dict(derived[1]) if derived is not None else {}
+        for col in SEARCHABLE_DROPDOWNS.values():
+            if col in self.search_indexes:
+                continue
+            categories = self.filter_index.categories.get(col, pd.Index([]))
+            reused = previous.search_indexes.get(col) if previous is not None else None
+            if reused is None or not previous.filter_index.categories.get(col, pd.Index([])).equals(categories):
+                with LOAD_STAGE_SECONDS.time(etapa='busca'):
+                    reused = PrefixIndex(categories)
+            self.search_indexes[col] = reused
+        # Opções dos dropdowns com lista fixa, enviadas quando a página descobre que os dados estão prontos
+        self.dropdown_options = {col: self._observed_options(col)
+                                 for col in ('Nome da Loja', 'Marca', 'Tipo do Produto')}
+        # Esqueletos dos gráficos principais: enviados uma vez por versão, depois só os vetores mudam
+        self.product_types = [option['value'] for option in self.dropdown_options['Tipo do Produto'][1:]]
+        self.main_figures = main_figure_skeletons(self.product_types)
+        self._lookups = lookups
+        if snapshot and derived is None and revenue_cube is not None:
+            # Primeiro worker desta versão: grava as estruturas e passa a usar as cópias mapeadas, como os demais
+            with LOAD_STAGE_SECONDS.time(etapa='derivados_gravacao'):
+                save_derived(self, snapshot)
+                derived = load_derived(snapshot, df, filter_index)
+            if derived is not None:
+                self.revenue_cube, self.search_indexes = derived
+
+    def _observed_options(self, col):
+        """Mesmo resultado de get_dropdown_options(self.df, col), a partir dos códigos do índice."""
+        codes = self.filter_index.codes.get(col)
+        if codes is None:
+            return get_dropdown_options(self.df, col)
+        categories = self.filter_index.categories[col]
+        observed = np.bincount(codes[codes >= 0], minlength=len(categories)) > 0
+        return [{'label': ALL_VALUES, 'value': ALL_VALUES}] + [{'label': str(v), 'value': str(v)}
+                                                               for v in categories[observed]]
+
+    def window_columns(self, date_range):
+        """Códigos das dimensões e medidas das vendas do período, no formato de um rollup do cubo."""
+        rows, dates = self.time_index.window(date_range)
+        columns = {col: codes[rows] for col, codes in self.filter_index.codes.items()}
+        columns[TIME_COLUMN] = self.revenue_cube.month_codes(dates)
+        for measure in CUBE_MEASURES:
+            columns[measure] = self.df[measure].to_numpy()[rows]
+        return columns
+
+    def aggregate(self, requests, selections, date_range=None):
+        """
+        RevenueCube.aggregate_many restrito ao período date_range (ver normalize_date_range).
+
+        Períodos de meses inteiros usam os rollups, fatiados por mês; os demais agregam
+        só as vendas do período, localizadas por busca binária no TimeIndex. Nos dois
+        casos o custo cai junto com o tamanho do período.
+        """
+        cube = self.revenue_cube
+        if date_range is None:
+            return cube.aggregate_many(requests, selections)
+        months = cube.month_range(date_range)
+        if months is not None:
+            return cube.aggregate_many(requests, selections, months)
+        active = {col: selected for col, selected in selections.items() if selected is not None}
+        return cube.aggregate_rows(requests, active, self.window_columns(date_range))
+
+    def lookups(self):
+        """Cadastros para enriquecer vendas novas; lidos na primeira ingestão e reaproveitados depois."""
+        if self._lookups is None:
+            self._lookups = load_lookups()
+        return self._lookups
+
+    def ingest(self, fingerprints):
+        """
+        Nova versão do dataset com os arquivos de vendas novos ou alterados em fingerprints.
+
+        Só esses arquivos são lidos e enriquecidos; as linhas dos demais são mantidas
+        e os índices e o cubo são estendidos em vez de reconstruídos.
+
+        Returns:
+            Dataset | None: None quando a ingestão incremental não se aplica (cadastro
+            alterado ou arquivo de vendas removido) e é preciso recarregar tudo.
+        """
+        sha = lambda sources, path: sources.get(path, {}).get('sha256')
+        if self.revenue_cube is None or any(sha(fingerprints, path) != sha(self.sources, path)
+                                            for path in CADASTRO_FILES):
+            return None
+        if any(path not in fingerprints for path, _ in self.sales_rows):
+            return None
+        changed = [path for path in fingerprints
+                   if path not in CADASTRO_FILES and sha(fingerprints, path) != sha(self.sources, path)]
+        if not changed:
+            return None
+
+        lookups = self.lookups()
+        with LOAD_STAGE_SECONDS.time(etapa='leitura_vendas'):
+            vendas = {path: pd.read_csv(path, encoding='utf-8') for path in changed}
+        chunks = {path: enrich_sales(df_vendas, lookups) for path, df_vendas in vendas.items()}
+        # Linhas antigas dos arquivos alterados saem; as dos demais arquivos ficam. Os blocos
+        # (um por arquivo) são numerados em [mantidas..., novas...] e reordenados por sales_block_key
+        dates = self.df[DATE_COLUMN].to_numpy()
+        kept, replaced, layout, start, offset = [], [], [], 0, 0
+        for path, n_rows in self.sales_rows:
+            rows = np.arange(start, start + n_rows, dtype=np.intp)
+            if path in chunks:
+                replaced.append(rows)
+            else:
+                kept.append(rows)
+                layout.append((sales_block_key(path, dates[start] if n_rows else None), path, offset, n_rows))
+                offset += n_rows
+            start += n_rows
+        for path, chunk in chunks.items():
+            first_date = chunk[DATE_COLUMN].iloc[0] if len(chunk) else None
+            layout.append((sales_block_key(path, first_date), path, offset, len(chunk)))
+            offset += len(chunk)
+        layout.sort(key=lambda block: block[0])
+        order = np.concatenate([np.arange(first, first + n_rows, dtype=np.intp) for _, _, first, n_rows in layout])
+        if (order == np.arange(len(order))).all():
+            order = None
+
+        keep, removed = None, None
+        if replaced:
+            keep = np.concatenate(kept) if kept else np.empty(0, dtype=np.intp)
+            removed = self.df.take(np.concatenate(replaced))
+        added = pd.concat(chunks.values(), ignore_index=True)
+        df = pd.concat([self.df if keep is None else self.df.take(keep), added], ignore_index=True)
+        if order is not None:
+            df = df.take(order).reset_index(drop=True)
+        df.attrs['arquivos_vendas'] = [[path, n_rows] for _, path, _, n_rows in layout]
+
+        with LOAD_STAGE_SECONDS.time(etapa='indices'):
+            filter_index = self.filter_index.extend(df, keep, added, order)
+        with LOAD_STAGE_SECONDS.time(etapa='cubo'):
+            revenue_cube = self.revenue_cube.extend(filter_index, added, removed)
+        stored = store_dataset(df, fingerprints, delta=(self.version, keep, added, order))
+        if stored is not df:
+            # Modo compartilhado: o DataFrame agora vem do snapshot mapeado e os índices de filtro são
+            # refeitos sobre os códigos dele; o cubo estendido é gravado junto do snapshot e mapeado
+            return Dataset(stored, revenue_cube=revenue_cube, lookups=lookups, previous=self)
+        return Dataset(df, filter_index, revenue_cube, lookups, previous=self)
+
+
+_dataset = None
+_load_error = None
+_loader = None
+_loader_lock = threading.Lock()
+_loaded = threading.Event()
+_refresh_lock = threading.Lock()
+
+
+def current_dataset():
+    """Dataset em uso, ou None enquanto os dados ainda estão sendo carregados."""
+    return _dataset
+
+
+def _load_dataset():
+    global _dataset, _load_error
+    try:
+        # Sem snapshot ainda, um worker o constrói e os demais o leem; no modo compartilhado
+        # ele grava também o cubo e os índices de busca, que os demais só mapeiam
+        with snapshot_lock():
+            df = load_data()
+            dataset = Dataset(df) if SHARED_DATA else None
+        if dataset is None:
+            dataset = Dataset(df)
+    except Exception as e: # Qualquer falha fica visível em /readyz em vez de derrubar o worker
+        print(f"Erro: Falha ao carregar os dados. Detalhe: {e}")
+        _load_error = str(e)
+        return
+    _load_error = "Arquivos de dados não encontrados" if dataset.df.empty else None
+    _dataset = dataset
+
+
+def refresh_dataset():
+    """
+    Verifica os arquivos de origem e, se algum mudou, publica uma nova versão do dataset.
+
+    Arquivos de vendas novos ou alterados são ingeridos incrementalmente
+    (Dataset.ingest); mudanças nos cadastros ou remoção de arquivos recarregam tudo.
+    Só um worker por vez publica (snapshot_lock): no modo compartilhado, os demais
+    mapeiam a versão que ele gravou em vez de ingerir de novo.
+    A troca é uma única atribuição: callbacks em andamento terminam com o Dataset
+    que já tinham, as seguintes usam o novo.
+
+    Returns:
+        Dataset | None: A nova versão, ou None se nada mudou.
+    """
+    global _dataset
+    with _refresh_lock:
+        ds = _dataset
+        if ds is None or ds.df.empty:
+            _load_dataset()
+            return _dataset
+        fingerprints = source_fingerprints(ds.sources)
+        if fingerprints is None:
+            return None # Arquivo ausente (talvez sendo copiado); tenta de novo na próxima verificação
+        if _dataset_version(fingerprints) == ds.version:
+            ds.sources = fingerprints # Só o mtime mudou; evita refazer o hash na próxima verificação
+            return None
+        with snapshot_lock():
+            manifest = _read_manifest(SNAPSHOT_DIR) if SHARED_DATA and SNAPSHOT_DIR else None
+            if manifest is not None and manifest['versao'] == _dataset_version(fingerprints):
+                new = Dataset(load_data(), lookups=ds._lookups, previous=ds)
+            else:
+                new = ds.ingest(fingerprints) or Dataset(load_data())
+        if new.df.empty:
+            return None
+        print(f"Dados atualizados: versão {new.version} ({len(new.df)} linhas)")
+        _dataset = new
+        return new
+
+
+def _load_and_watch():
+    if _dataset is None:
+        _load_dataset()
+    _loaded.set()
+    while REFRESH_INTERVAL > 0:
+        time.sleep(REFRESH_INTERVAL)
+        try:
+            refresh_dataset()
+        except Exception as e:
+            print(f"Erro: Falha ao atualizar os dados. Detalhe: {e}")
+
+
+def start_background_load():
+    """
+    Inicia, uma única vez por processo, a thread que carrega os dados e depois
+    verifica a cada REFRESH_INTERVAL segundos se há arquivos novos ou alterados.
+    """
+    global _loader
+    with _loader_lock:
+        if _loader is None:
+            _loader = threading.Thread(target=_load_and_watch, name='carregamento-dados', daemon=True)
+            _loader.start()
+    return _loader
+
+
+def wait_for_dataset(timeout=None):
+    """Inicia o carregamento se preciso e espera até timeout segundos. Retorna current_dataset()."""
+    start_background_load()
+    _loaded.wait(timeout)
+    return current_dataset()
+
+
+def _reset_loader_after_fork():
+    # Threads não sobrevivem ao fork (ex.: gunicorn --preload): o worker inicia a sua ao subir
+    # (post_worker_init em gunicorn.conf.py), recomeçando o carregamento se o processo pai não terminou
+    global _loader, _loader_lock, _refresh_lock, _loaded
+    _loader_lock = threading.Lock()
+    _refresh_lock = threading.Lock()
+    _loader = None
+    if _dataset is None:
+        _loaded = threading.Event()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_loader_after_fork)
+
+
+# --- Cache de resultados das callbacks ---
+
+# Número máximo de resultados guardados (LRU)
+CACHE_SIZE = int(os.environ.get('DASH_CACHE_SIZE', '256'))
+# Arquivo SQLite compartilhado entre os workers; vazio mantém o cache só em memória, por processo
+CACHE_PATH = os.environ.get('DASH_CACHE_PATH', '')
+
+
+def canonical_selection(selected):
+    """Forma canônica de um valor de dropdown: None para 'sem filtro', senão tupla ordenada sem repetições."""
+    selected = normalize_selection(selected)
+    return None if selected is None else tuple(sorted({str(v) for v in selected}))
+
+
+def _json_default(value):
+    """Tipos que json.dumps não conhece: figuras Plotly viram o dict que o Dash serializaria, DataFrames o formato 'split'."""
+    if isinstance(value, pd.DataFrame):
+        return {'__dataframe__': value.to_dict('split')}
+    if hasattr(value, 'to_plotly_json'):
+        return value.to_plotly_json()
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError(f"Resultado de tipo {type(value).__name__} não pode ir para o cache compartilhado")
+
+
+def encode_payload(value):
+    """
+    Resultado de uma callback em JSON, para o cache compartilhado. JSON e não pickle: o
+    arquivo do cache é lido por todos os workers e não pode executar código ao ser lido.
+    """
+    return json.dumps(value, default=_json_default, ensure_ascii=False)
+
+
+def decode_payload(text):
+    """Inverso de encode_payload (tuplas voltam como listas)."""
+    return json.loads(text, object_hook=lambda d: pd.DataFrame(**d['__dataframe__']) if '__dataframe__' in d else d)
+
+
+class ResultCache:
+    """
+    Cache LRU limitado para os resultados (figuras e dados de tabela) das callbacks.
+
+    As chaves são o nome da callback mais a forma canônica dos argumentos, e só
+    valem para a versão do dataset em que foram calculadas: quando version()
+    muda, as entradas antigas são descartadas. Com path, os resultados ficam num
+    arquivo SQLite compartilhado pelos workers e sobrevivem à reciclagem deles.
+    """
+
+    def __init__(self, max_entries=CACHE_SIZE, path=CACHE_PATH, version=lambda: ''):
+        self.max_entries = max_entries
+        self.path = path
+        self.version = version
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._entries_version = None
+        self._local = threading.local()
+
+    def stats(self):
+        """Contadores de hits/misses/evictions/invalidations deste processo e número de entradas."""
+        with self._lock:
+            stats = dict(self.counters)
+            if not self.path:
+                stats['entries'] = len(self._entries)
+                return stats
+        try:
+            stats['entries'] = self._connection().execute("SELECT COUNT(*) FROM resultados").fetchone()[0]
+        except sqlite3.Error:
+            stats['entries'] = None
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.path:
+            with self._connection() as conn:
+                conn.execute("DELETE FROM resultados")
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS resultados ("
+                         "chave TEXT PRIMARY KEY, versao TEXT NOT NULL, valor TEXT NOT NULL, acesso REAL NOT NULL)")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, version=None):
+        """Retorna (True, valor) num hit ou (False, None) num miss."""
+        version = self.version() if version is None else version
+        if self.path:
+            try:
+                with self._connection() as conn:
+                    row = conn.execute("SELECT valor FROM resultados WHERE chave = ? AND versao = ?",
+                                       (key, version)).fetchone()
+                    if row is not None:
+                        conn.execute("UPDATE resultados SET acesso = ? WHERE chave = ?", (time.time(), key))
+                value = None if row is None else decode_payload(row[0])
+            except (sqlite3.Error, ValueError): # ValueError: valor ilegível (ex.: gravado em outro formato)
+                row = None
+            self._count('misses' if row is None else 'hits')
+            return (False, None) if row is None else (True, value)
+
+        with self._lock:
+            if self._entries_version != version:
+                self.counters['invalidations'] += len(self._entries)
+                self._entries.clear()
+                self._entries_version = version
+            if key not in self._entries:
+                self.counters['misses'] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return True, self._entries[key]
+
+    def set(self, key, value, version=None):
+        version = self.version() if version is None else version
+        if self.path:
+            try:
+                with self._connection() as conn:
+                    conn.execute("INSERT OR REPLACE INTO resultados VALUES (?, ?, ?, ?)",
+                                 (key, version, encode_payload(value), time.time()))
+                    stale = conn.execute("DELETE FROM resultados WHERE versao != ?", (version,)).rowcount
+                    excess = conn.execute("SELECT COUNT(*) FROM resultados").fetchone()[0] - self.max_entries
+                    evicted = 0
+                    if excess > 0:
+                        evicted = conn.execute("DELETE FROM resultados WHERE chave IN "
+                                               "(SELECT chave FROM resultados ORDER BY acesso LIMIT ?)",
+                                               (excess,)).rowcount
+            except (sqlite3.Error, TypeError) as e:
+                print(f"Aviso: Falha ao gravar no cache {self.path}. Detalhe: {e}")
+                return
+            self._count('invalidations', stale)
+            self._count('evictions', evicted)
+            return
+
+        with self._lock:
+            if self._entries_version != version:
+                self.counters['invalidations'] += len(self._entries)
+                self._entries.clear()
+                self._entries_version = version
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def memoize(self, name):
+        """
+        Decorator que guarda o retorno da função sob a forma canônica dos seus argumentos.
+
+        O primeiro argumento da função é o Dataset que a callback leu: ele não entra na
+        chave e o resultado vale para a versão dele. Se esse Dataset já foi substituído
+        por um refresh, a função é calculada sem consultar nem alimentar o cache.
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(ds, *args):
+                version = ds.version
+                if version != self.version():
+                    _current_trace()['cache'] = 'miss'
+                    return func(ds, *args)
+                key = json.dumps([name] + [canonical_selection(arg) for arg in args], ensure_ascii=False)
+                found, value = self.get(key, version)
+                _current_trace()['cache'] = 'hit' if found else 'miss'
+                if not found:
+                    value = func(ds, *args)
+                    if self.version() == version: # Trocado durante o cálculo: não guarda a versão antiga
+                        self.set(key, value, version)
+                return value
+            return wrapper
+        return decorator
+
+
+result_cache = ResultCache(version=lambda: _dataset.version if _dataset is not None else '')
 
 # Inicializar o aplicativo Dash
 app = dash.Dash(__name__, suppress_callback_exceptions=True)
 server = app.server # Para implantação no Render
 
+
+@server.before_request
+def _ensure_data_loading():
+    # O servidor responde desde o início. Com o gunicorn.conf.py os dados já carregam desde que o
+    # worker sobe; em outros servidores WSGI começam na primeira requisição
+    start_background_load()
+
+
+@server.before_request
+def _start_request_trace():
+    if flask.request.path.endswith('/_dash-update-component'):
+        _trace.current = {'callback': None, 'etapas': {}, 'inicio': time.perf_counter()}
+
+
+@server.after_request
+def _finish_request_trace(response):
+    trace = getattr(_trace, 'current', None)
+    _trace.current = None
+    if trace is None or 'inicio' not in trace:
+        return response
+    total = time.perf_counter() - trace['inicio']
+    body = flask.request.get_json(silent=True) or {}
+    callback = trace['callback'] or body.get('output', 'desconhecida')
+    size = response.content_length if response.content_length is not None else len(response.get_data())
+    REQUEST_SECONDS.observe(total, callback=callback)
+    RESPONSE_BYTES.observe(size, callback=callback)
+    if 'duracao' in trace:
+        # O que o Dash faz fora da função da callback: basicamente serializar a resposta em JSON
+        trace['etapas']['serializacao'] = max(total - trace['duracao'], 0.0)
+        CALLBACK_STAGE_SECONDS.observe(trace['etapas']['serializacao'], callback=callback, etapa='serializacao')
+
+    if SLOW_REQUEST_MS and total * 1000 >= SLOW_REQUEST_MS:
+        SLOW_REQUESTS.inc(callback=callback)
+        filtros = {f"{item['id']}.{item['property']}": item.get('value')
+                   for item in body.get('inputs', []) + body.get('state', [])
+                   if isinstance(item, dict) and 'id' in item}
+        print("Aviso: requisição lenta " + json.dumps({
+            'callback': callback,
+            'total_ms': round(total * 1000, 1),
+            'etapas_ms': {name: round(seconds * 1000, 1) for name, seconds in trace['etapas'].items()},
+            'cache': trace.get('cache'),
+            'bytes': size,
+            'filtros': filtros,
+        }, ensure_ascii=False, default=str))
+    return response
+
+
+@server.route('/metrics')
+def metrics():
+    """Métricas deste processo no formato texto do Prometheus."""
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    ds = current_dataset()
+    lines += ["# HELP dashboard_dataset_rows Linhas do dataset em uso (0 enquanto carrega).",
+              "# TYPE dashboard_dataset_rows gauge",
+              f"dashboard_dataset_rows {len(ds.df) if ds is not None else 0}",
+              "# HELP dashboard_dataset_info Versão do dataset em uso.",
+              "# TYPE dashboard_dataset_info gauge"]
+    if ds is not None:
+        lines.append(f"dashboard_dataset_info{_format_labels([('versao', ds.version)])} 1")
+    stats = result_cache.stats()
+    lines += ["# HELP dashboard_result_cache_events_total Eventos do cache de resultados neste processo.",
+              "# TYPE dashboard_result_cache_events_total counter"]
+    lines += [f'dashboard_result_cache_events_total{{evento="{event}"}} {stats[event]}'
+              for event in ('hits', 'misses', 'evictions', 'invalidations')]
+    if stats.get('entries') is not None:
+        lines += ["# HELP dashboard_result_cache_entries Entradas no cache de resultados.",
+                  "# TYPE dashboard_result_cache_entries gauge",
+                  f"dashboard_result_cache_entries {stats['entries']}"]
+    return flask.Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+@server.route('/healthz')
+def healthz():
+    """Liveness: o processo está de pé e atendendo requisições."""
+    return flask.jsonify(status='ok')
+
+
+@server.route('/readyz')
+def readyz():
+    """Readiness: 200 com a versão do dataset quando os dados estão carregados, 503 antes disso."""
+    ds = current_dataset()
+    if ds is not None and not ds.df.empty:
+        return flask.jsonify(status='pronto', versao=ds.version, linhas=len(ds.df))
+    if _load_error:
+        return flask.jsonify(status='erro', detalhe=_load_error), 503
+    return flask.jsonify(status='carregando'), 503
+
 # Helper function to generate dropdown options
 def get_dropdown_options(df, column_name, add_all_values_option=True):
     """
@@ -98,9 +2060,30 @@ def get_dropdown_options(df, column_name, add_all_values_option=True):
     return options
 
 
+def get_selected_options(selected, add_all_values_option=True):
+    """
+    Options de um dcc.Dropdown com busca no servidor: apenas ALL_VALUES e os valores
+    selecionados, para que a seleção continue visível sem enviar o cadastro inteiro.
+    """
+    options = [{'label': ALL_VALUES, 'value': ALL_VALUES}] if add_all_values_option else []
+    if selected and not isinstance(selected, list):
+        selected = [selected]
+    options.extend({'label': str(v), 'value': str(v)} for v in (selected or []) if v != ALL_VALUES)
+    return options
+
+
+# Colunas da tabela de resumo por marca
+BRAND_TABLE_COLUMNS = ['Marca', 'Quantidade Vendida Total', 'Receita Total (R$)']
+
 # --- Layout do Dashboard ---
 app.layout = html.Div(style={'fontFamily': 'Arial, sans-serif', 'padding': '20px'}, children=[
     html.H1("Dashboard de Vendas Interativo", style={'textAlign': 'center', 'color': '#007BFF', 'marginBottom': '30px'}),
+    html.Div(id='status-carregamento', children="Carregando dados...", style={'textAlign': 'center', 'color': '#777', 'marginBottom': '20px'}),
+    # Versão do dataset carregado; ao mudar, as callbacks dos gráficos rodam de novo
+    dcc.Store(id='store-versao-dados'),
+    # Versão cujos esqueletos de figura o navegador já tem; com ela, update_main_graphs responde com dash.Patch
+    dcc.Store(id='store-versao-figuras'),
+    dcc.Interval(id='interval-carregamento', interval=1000),
 
     # --- Seção de Filtros Globais ---
     html.Div(className="global-filters-container", style={'marginBottom': '40px', 'padding': '20px', 'border': '1px solid #ddd', 'borderRadius': '8px', 'backgroundColor': '#f9f9f9'}, children=[
@@ -110,17 +2093,17 @@ app.layout = html.Div(style={'fontFamily': 'Arial, sans-serif', 'padding': '20px
                 html.Label("Produto:", style={'fontWeight': 'bold', 'display': 'block', 'marginBottom': '5px'}),
                 dcc.Dropdown(
                     id='dropdown-produto',
-                    options=get_dropdown_options(df_global, 'Produto'),
+                    options=get_selected_options(ALL_VALUES), # Demais opções vêm da busca (search_options_produto)
                     value=ALL_VALUES,
                     multi=True, 
-                    placeholder="Selecione Produtos"
+                    placeholder="Digite para buscar Produtos"
                 )
             ]),
             html.Div(style={'flex': '1 1 180px'}, children=[
                 html.Label("Loja:", style={'fontWeight': 'bold', 'display': 'block', 'marginBottom': '5px'}),
                 dcc.Dropdown(
                     id='dropdown-loja',
-                    options=get_dropdown_options(df_global, 'Nome da Loja'),
+                    options=get_selected_options(ALL_VALUES), # Lista completa chega com update_dataset_status
                     value=ALL_VALUES,
                     multi=True,
                     placeholder="Selecione Lojas"
@@ -130,17 +2113,17 @@ app.layout = html.Div(style={'fontFamily': 'Arial, sans-serif', 'padding': '20px
                 html.Label("Cliente:", style={'fontWeight': 'bold', 'display': 'block', 'marginBottom': '5px'}),
                 dcc.Dropdown(
                     id='dropdown-cliente',
-                    options=get_dropdown_options(df_global, 'Nome Completo'),
+                    options=get_selected_options(ALL_VALUES), # Demais opções vêm da busca (search_options_cliente)
                     value=ALL_VALUES,
                     multi=True,
-                    placeholder="Selecione Clientes"
+                    placeholder="Digite para buscar Clientes"
                 )
             ]),
             html.Div(style={'flex': '1 1 180px'}, children=[
                 html.Label("Marca do Produto:", style={'fontWeight': 'bold', 'display': 'block', 'marginBottom': '5px'}),
                 dcc.Dropdown(
                     id='dropdown-marca',
-                    options=get_dropdown_options(df_global, 'Marca'),
+                    options=get_selected_options(ALL_VALUES), # Lista completa chega com update_dataset_status
                     value=ALL_VALUES,
                     multi=True,
                     placeholder="Selecione Marcas"
@@ -150,12 +2133,30 @@ app.layout = html.Div(style={'fontFamily': 'Arial, sans-serif', 'padding': '20px
                 html.Label("Tipo do Produto:", style={'fontWeight': 'bold', 'display': 'block', 'marginBottom': '5px'}),
                 dcc.Dropdown(
                     id='dropdown-tipo-produto',
-                    options=get_dropdown_options(df_global, 'Tipo do Produto'),
+                    options=get_selected_options(ALL_VALUES), # Lista completa chega com update_dataset_status
                     value=ALL_VALUES,
                     multi=True,
                     placeholder="Selecione Tipos"
                 )
             ]),
+            html.Div(style={'flex': '1 1 260px'}, children=[
+                html.Label("Período da Venda:", style={'fontWeight': 'bold', 'display': 'block', 'marginBottom': '5px'}),
+                dcc.DatePickerRange(
+                    id='date-range-venda', # Limites chegam com update_dataset_status
+                    display_format='DD/MM/YYYY',
+                    start_date_placeholder_text="Início",
+                    end_date_placeholder_text="Fim",
+                    clearable=True
+                ),
+                dcc.RadioItems(
+                    id='radio-granularidade-data',
+                    options=[{'label': 'Dia', 'value': 'dia'}, {'label': 'Mês inteiro', 'value': 'mes'}],
+                    value='dia',
+                    inline=True,
+                    style={'marginTop': '5px'},
+                    inputStyle={'marginRight': '4px', 'marginLeft': '8px'}
+                )
+            ]),
         ])
     ]),
 
@@ -185,12 +2186,18 @@ app.layout = html.Div(style={'fontFamily': 'Arial, sans-serif', 'padding': '20px
             html.H4("Resumo de Vendas por Marca", style={'textAlign': 'center'}),
             dash_table.DataTable(
                 id='table-vendas-marca',
-                columns=[], 
+                columns=[{"name": i, "id": i} for i in BRAND_TABLE_COLUMNS],
                 data=[],    
                 style_table={'overflowX': 'auto', 'height': '300px', 'overflowY': 'auto'},
                 style_cell={'textAlign': 'left', 'padding': '5px', 'minWidth': '100px', 'width': '150px', 'maxWidth': '200px'},
                 style_header={'backgroundColor': 'rgb(230, 230, 230)', 'fontWeight': 'bold'},
+                # Paginação e ordenação no servidor (update_tabela_marca): só a página visível é enviada
+                page_action='custom',
+                page_current=0,
                 page_size=10,
+                sort_action='custom',
+                sort_mode='single',
+                sort_by=[],
             )
         ]),
     ]),
@@ -203,7 +2210,7 @@ app.layout = html.Div(style={'fontFamily': 'Arial, sans-serif', 'padding': '20px
                 html.Label("Selecione o Tipo do Produto:", style={'fontWeight': 'bold', 'display': 'block', 'marginBottom': '5px'}),
                 dcc.Dropdown(
                     id='dropdown-cascata-tipo-produto',
-                    options=get_dropdown_options(df_global, 'Tipo do Produto', add_all_values_option=False), # No 'ALL' option here
+                    options=[], # Preenchido por update_dataset_status, sem a opção 'ALL'
                     placeholder="Selecione um Tipo"
                 )
             ]),
@@ -225,30 +2232,99 @@ app.layout = html.Div(style={'fontFamily': 'Arial, sans-serif', 'padding': '20px
 
 # --- Callbacks ---
 
-def apply_filters(df, selected_produtos, selected_lojas, selected_clientes, selected_marcas, selected_tipos_produto):
-    """Aplica os filtros globais ao DataFrame."""
-    dff = df.copy()
-    # Ensure selections are lists, even if single value or None is passed initially by multi-select dropdowns
-    if selected_produtos and not (isinstance(selected_produtos, list) and ALL_VALUES in selected_produtos) and ALL_VALUES not in selected_produtos:
-         if not isinstance(selected_produtos, list): selected_produtos = [selected_produtos]
-         dff = dff[dff['Produto'].isin(selected_produtos)]
-    
-    if selected_lojas and not (isinstance(selected_lojas, list) and ALL_VALUES in selected_lojas) and ALL_VALUES not in selected_lojas:
-        if not isinstance(selected_lojas, list): selected_lojas = [selected_lojas]
-        dff = dff[dff['Nome da Loja'].isin(selected_lojas)]
+@app.callback(
+    [Output('store-versao-dados', 'data'),
+     Output('interval-carregamento', 'disabled'),
+     Output('interval-carregamento', 'interval'),
+     Output('status-carregamento', 'children'),
+     Output('dropdown-loja', 'options'),
+     Output('dropdown-marca', 'options'),
+     Output('dropdown-tipo-produto', 'options'),
+     Output('dropdown-cascata-tipo-produto', 'options'),
+     Output('date-range-venda', 'min_date_allowed'),
+     Output('date-range-venda', 'max_date_allowed')],
+    [Input('interval-carregamento', 'n_intervals')],
+    [State('store-versao-dados', 'data')]
+)
+@instrumented('update_dataset_status')
+def update_dataset_status(n_intervals, versao_atual):
+    """
+    Acompanha o carregamento em segundo plano e entrega as opções fixas quando os dados ficam prontos.
 
-    if selected_clientes and not (isinstance(selected_clientes, list) and ALL_VALUES in selected_clientes) and ALL_VALUES not in selected_clientes:
-        if not isinstance(selected_clientes, list): selected_clientes = [selected_clientes]
-        dff = dff[dff['Nome Completo'].isin(selected_clientes)]
+    Com DASH_REFRESH_INTERVAL ativo a página continua consultando, no mesmo ritmo das
+    verificações do servidor, e redesenha os gráficos quando uma nova versão é publicada.
+    Isso vale também depois de uma falha na carga, que o servidor tenta de novo a cada verificação.
+    """
+    ds = current_dataset()
+    unchanged = (dash.no_update,) * 6
+    # Depois da carga inicial (ou da falha dela), só consulta de novo se o servidor procura atualizações
+    polling = (not REFRESH_INTERVAL > 0, int(REFRESH_INTERVAL * 1000) if REFRESH_INTERVAL > 0 else dash.no_update)
+    if ds is None:
+        if _load_error:
+            return (dash.no_update,) + polling + (f"Erro ao carregar os dados: {_load_error}",) + unchanged
+        return (dash.no_update, False, dash.no_update, "Carregando dados...") + unchanged
+    if ds.version == versao_atual:
+        raise PreventUpdate
+    if ds.df.empty:
+        return (ds.version,) + polling + ("Dados não disponíveis",) + unchanged
+    options = ds.dropdown_options
+    dates = ds.time_index.dates
+    return ((ds.version,) + polling + ("", options['Nome da Loja'], options['Marca'], options['Tipo do Produto'],
+                                      options['Tipo do Produto'][1:], # Cascata não tem a opção 'ALL'
+                                      str(dates[0].astype('datetime64[D]')), str(dates[-1].astype('datetime64[D]'))))
+
+def apply_filters(ds, selected_produtos, selected_lojas, selected_clientes, selected_marcas, selected_tipos_produto,
+                  start_date=None, end_date=None, granularidade='dia'):
+    """
+    Aplica os filtros globais (dimensões e período) ao DataFrame do Dataset ds.
 
-    if selected_marcas and not (isinstance(selected_marcas, list) and ALL_VALUES in selected_marcas) and ALL_VALUES not in selected_marcas:
-        if not isinstance(selected_marcas, list): selected_marcas = [selected_marcas]
-        dff = dff[dff['Marca'].isin(selected_marcas)]
+    O período vira uma fatia contígua das linhas (ds.time_index) e os filtros de dimensão
+    (ds.filter_index) só examinam as linhas dessa fatia. Sem filtros ativos devolve o
+    próprio ds.df (sem cópia); quem chama só lê o resultado.
+    """
+    date_range = normalize_date_range(start_date, end_date, granularidade)
+    rows = None if date_range is None else ds.time_index.window(date_range)[0]
+    positions = ds.filter_index.positions(filter_selections(selected_produtos, selected_lojas, selected_clientes,
+                                                            selected_marcas, selected_tipos_produto), rows)
+    if positions is None:
+        return ds.df
+    return ds.df.take(positions)
 
-    if selected_tipos_produto and not (isinstance(selected_tipos_produto, list) and ALL_VALUES in selected_tipos_produto) and ALL_VALUES not in selected_tipos_produto:
-        if not isinstance(selected_tipos_produto, list): selected_tipos_produto = [selected_tipos_produto]
-        dff = dff[dff['Tipo do Produto'].isin(selected_tipos_produto)]
-    return dff
+# Agregações de update_main_graphs: (nome, colunas de agrupamento, top k)
+MAIN_AGGREGATIONS = [
+    ('receita_ano', ['Ano da Venda'], None),
+    ('top_clientes', ['Nome Completo'], 10),
+    ('top_produtos', ['Produto'], 10),
+    ('top_lojas', ['Nome da Loja'], 15),
+    ('receita_tipo_tempo', ['MesAno da Venda', 'Tipo do Produto'], None),
+]
+# Agregação da tabela por marca (update_tabela_marca)
+BRAND_AGGREGATIONS = [('vendas_marca', ['Marca'], None)]
+
+# Entradas dos filtros globais, comuns aos gráficos principais e à tabela por marca
+FILTER_INPUTS = [
+    Input('dropdown-produto', 'value'),
+    Input('dropdown-loja', 'value'),
+    Input('dropdown-cliente', 'value'),
+    Input('dropdown-marca', 'value'),
+    Input('dropdown-tipo-produto', 'value'),
+    Input('date-range-venda', 'start_date'),
+    Input('date-range-venda', 'end_date'),
+    Input('radio-granularidade-data', 'value'),
+    Input('store-versao-dados', 'data'),
+]
+
+@result_cache.memoize('main_graphs_data')
+def main_graphs_data(ds, selected_produtos, selected_lojas, selected_clientes, selected_marcas, selected_tipos_produto,
+                     start_date=None, end_date=None, granularidade='dia'):
+    """Vetores dos traços dos gráficos principais de ds (ver main_figure_traces), ou None sem vendas nos filtros."""
+    selections = filter_selections(selected_produtos, selected_lojas, selected_clientes, selected_marcas, selected_tipos_produto)
+    date_range = normalize_date_range(start_date, end_date, granularidade)
+    aggregates = ds.aggregate(MAIN_AGGREGATIONS, selections, date_range)
+    if aggregates['receita_ano'].empty:
+        return None
+    with callback_stage('figuras'):
+        return main_figure_traces(aggregates, ds.product_types)
 
 @app.callback(
     [Output('graph-receita-ano', 'figure'),
@@ -256,116 +2332,175 @@ def apply_filters(df, selected_produtos, selected_lojas, selected_clientes, sele
      Output('graph-top-produtos', 'figure'),
      Output('graph-receita-loja', 'figure'),
      Output('graph-receita-tipo-produto-tempo', 'figure'),
-     Output('table-vendas-marca', 'data'),
-     Output('table-vendas-marca', 'columns')],
-    [Input('dropdown-produto', 'value'),
-     Input('dropdown-loja', 'value'),
-     Input('dropdown-cliente', 'value'),
-     Input('dropdown-marca', 'value'),
-     Input('dropdown-tipo-produto', 'value')]
+     Output('store-versao-figuras', 'data')],
+    FILTER_INPUTS,
+    [State('store-versao-figuras', 'data')]
 )
-def update_main_graphs(selected_produtos, selected_lojas, selected_clientes, selected_marcas, selected_tipos_produto):
-    if df_global.empty: 
+@instrumented('update_main_graphs')
+def update_main_graphs(selected_produtos, selected_lojas, selected_clientes, selected_marcas, selected_tipos_produto,
+                       start_date=None, end_date=None, granularidade='dia', versao_dados=None, versao_figuras=None):
+    """
+    Os cinco gráficos principais. A primeira resposta de cada versão dos dados leva as
+    figuras completas (esqueletos de Dataset.main_figures); depois, enquanto só os filtros
+    mudam, cada gráfico recebe um dash.Patch com os novos vetores dos traços.
+    """
+    ds = current_dataset()
+    if ds is None:
+        loading_fig = {'data': [], 'layout': {'title': 'Carregando dados...'}}
+        return loading_fig, loading_fig, loading_fig, loading_fig, loading_fig, None
+
+    if ds.df.empty: 
         empty_fig = {'data': [], 'layout': {'title': 'Dados não disponíveis'}}
-        return empty_fig, empty_fig, empty_fig, empty_fig, empty_fig, [], []
-    
-    dff = apply_filters(df_global, selected_produtos, selected_lojas, selected_clientes, selected_marcas, selected_tipos_produto)
+        return empty_fig, empty_fig, empty_fig, empty_fig, empty_fig, None
 
-    if dff.empty: 
+    # Traços, esqueletos e versão vêm todos do mesmo Dataset, mesmo que um refresh o troque no meio
+    traces = main_graphs_data(ds, selected_produtos, selected_lojas, selected_clientes, selected_marcas,
+                              selected_tipos_produto, start_date, end_date, granularidade)
+    if traces is None:
+        # O aviso substitui os esqueletos: a próxima resposta com dados volta a mandar figuras completas
         empty_fig = {'data': [], 'layout': {'title': 'Nenhum dado para os filtros selecionados'}}
-        return empty_fig, empty_fig, empty_fig, empty_fig, empty_fig, [], []
-
-    # Gráfico 1: Receita Total por Ano
-    receita_ano_df = dff.groupby('Ano da Venda')['Receita'].sum().reset_index()
-    fig_receita_ano = px.line(receita_ano_df, x='Ano da Venda', y='Receita', markers=True,
-                              labels={'Ano da Venda': 'Ano', 'Receita': 'Receita Total (R$)'})
-    fig_receita_ano.update_layout(xaxis_type='category') 
-
-    # Gráfico 2: Top 10 Clientes por Receita
-    top_clientes_df = dff.groupby('Nome Completo')['Receita'].sum().nlargest(10).reset_index()
-    fig_top_clientes = px.bar(top_clientes_df, y='Nome Completo', x='Receita', orientation='h',
-                              labels={'Nome Completo': 'Cliente', 'Receita': 'Receita Total (R$)'})
-    fig_top_clientes.update_layout(yaxis={'categoryorder':'total ascending'})
-
-    # Gráfico 3: Top 10 Produtos por Receita
-    top_produtos_df = dff.groupby('Produto')['Receita'].sum().nlargest(10).reset_index()
-    fig_top_produtos = px.bar(top_produtos_df, x='Produto', y='Receita',
-                               labels={'Produto': 'Produto', 'Receita': 'Receita Total (R$)'})
-    fig_top_produtos.update_layout(xaxis={'categoryorder':'total descending'})
-
-    # Gráfico 4: Top 15 Lojas por Receita (Alterado de Pizza para Barras Horizontais)
-    receita_loja_df = dff.groupby('Nome da Loja')['Receita'].sum().nlargest(15).reset_index()
-    fig_receita_loja = px.bar(receita_loja_df, y='Nome da Loja', x='Receita', orientation='h',
-                              labels={'Nome da Loja': 'Loja', 'Receita': 'Receita Total (R$)'},
-                              title="Top 15 Lojas por Receita")
-    fig_receita_loja.update_layout(yaxis={'categoryorder':'total ascending'})
-
-
-    # Gráfico 5: Receita por Tipo de Produto ao Longo do Tempo (Mensal)
-    receita_tipo_tempo_df = dff.groupby(['MesAno da Venda', 'Tipo do Produto'])['Receita'].sum().reset_index()
-    receita_tipo_tempo_df = receita_tipo_tempo_df.sort_values('MesAno da Venda')
-    fig_receita_tipo_tempo = px.area(receita_tipo_tempo_df, x='MesAno da Venda', y='Receita', color='Tipo do Produto',
-                                     labels={'MesAno da Venda': 'Mês-Ano', 'Receita': 'Receita (R$)', 'Tipo do Produto': 'Tipo de Produto'})
-    fig_receita_tipo_tempo.update_xaxes(tickangle=45)
-
-    # Tabela 6: Resumo de Vendas por Marca
-    vendas_marca_df = dff.groupby('Marca').agg(
-        Total_Qtd_Vendida=('Qtd Vendida', 'sum'),
-        Total_Receita=('Receita', 'sum')
-    ).reset_index()
-    vendas_marca_df.rename(columns={'Marca': 'Marca', 
-                                    'Total_Qtd_Vendida': 'Quantidade Vendida Total', 
-                                    'Total_Receita': 'Receita Total (R$)'}, inplace=True)
-    
-    table_cols = [{"name": i, "id": i} for i in vendas_marca_df.columns]
-    table_data = vendas_marca_df.to_dict('records')
+        return empty_fig, empty_fig, empty_fig, empty_fig, empty_fig, None
+
+    with callback_stage('figuras'):
+        if versao_figuras == ds.version:
+            return tuple(patch_figure(figure_traces) for figure_traces in traces) + (dash.no_update,)
+        figures = tuple(fill_figure(skeleton, figure_traces) for skeleton, figure_traces in zip(ds.main_figures, traces))
+    return figures + (ds.version,)
+
+@result_cache.memoize('brand_summary')
+def brand_summary(ds, selected_produtos, selected_lojas, selected_clientes, selected_marcas, selected_tipos_produto,
+                  start_date=None, end_date=None, granularidade='dia'):
+    """Resumo de vendas por marca de ds (colunas BRAND_TABLE_COLUMNS) nos filtros globais, em ordem de Marca."""
+    selections = filter_selections(selected_produtos, selected_lojas, selected_clientes, selected_marcas, selected_tipos_produto)
+    date_range = normalize_date_range(start_date, end_date, granularidade)
+    vendas_marca = ds.aggregate(BRAND_AGGREGATIONS, selections, date_range)['vendas_marca']
+    vendas_marca_df = vendas_marca[['Qtd Vendida', 'Receita']].reset_index()
+    return vendas_marca_df.rename(columns={'Qtd Vendida': 'Quantidade Vendida Total', 'Receita': 'Receita Total (R$)'})
+
+@app.callback(
+    [Output('table-vendas-marca', 'data'),
+     Output('table-vendas-marca', 'page_count'),
+     Output('table-vendas-marca', 'page_current')],
+    FILTER_INPUTS + [
+     Input('table-vendas-marca', 'page_current'),
+     Input('table-vendas-marca', 'page_size'),
+     Input('table-vendas-marca', 'sort_by')]
+)
+@instrumented('update_tabela_marca')
+def update_tabela_marca(selected_produtos, selected_lojas, selected_clientes, selected_marcas, selected_tipos_produto,
+                        start_date, end_date, granularidade, versao_dados, page_current, page_size, sort_by):
+    """
+    Tabela 6: Resumo de Vendas por Marca, paginada e ordenada no servidor.
 
-    return fig_receita_ano, fig_top_clientes, fig_top_produtos, fig_receita_loja, fig_receita_tipo_tempo, table_data, table_cols
+    Só a página visível vai ao navegador. Quando os filtros reduzem o número de páginas,
+    a página atual é trazida para a última existente.
+    """
+    ds = current_dataset()
+    if ds is None or ds.df.empty:
+        return [], 1, 0
+    summary = brand_summary(ds, selected_produtos, selected_lojas, selected_clientes, selected_marcas,
+                            selected_tipos_produto, start_date, end_date, granularidade)
+    with callback_stage('tabela'):
+        if sort_by and sort_by[0].get('column_id') in summary.columns:
+            summary = summary.sort_values(sort_by[0]['column_id'], ascending=sort_by[0].get('direction') != 'desc',
+                                          kind='stable')
+        page_size = page_size or 10
+        page_count = max(1, -(-len(summary) // page_size))
+        page = min(page_current or 0, page_count - 1)
+        table_data = summary.iloc[page * page_size:(page + 1) * page_size].to_dict('records')
+    return table_data, page_count, (dash.no_update if page == page_current else page)
 
 @app.callback(
     Output('dropdown-cascata-marca', 'options'),
     [Input('dropdown-cascata-tipo-produto', 'value')]
 )
+@instrumented('update_marcas_dropdown')
 def update_marcas_dropdown(selected_tipo_produto):
-    if not selected_tipo_produto or df_global.empty:
+    ds = current_dataset()
+    if not selected_tipo_produto or ds is None or ds.df.empty:
         return []
-    
-    # Filter df_global for the selected 'Tipo do Produto' first
-    marcas_df = df_global[df_global['Tipo do Produto'] == selected_tipo_produto]
-    
-    # Then get unique 'Marca' values from this filtered DataFrame
-    options = get_dropdown_options(marcas_df, 'Marca', add_all_values_option=False) # No 'ALL' for this one
-    return options
+    # Marcas vendidas do Tipo, já ordenadas na carga (ProductHierarchy); sem a opção 'ALL'
+    return ds.hierarchy.brands(selected_tipo_produto)
+
+@result_cache.memoize('cascade_figure')
+def cascade_figure(ds, selected_tipo_produto, selected_marca):
+    """Figura da Receita por Produto de um Tipo e Marca em ds (seção em cascata)."""
+    receita_produto_filtrado_df = ds.hierarchy.revenue_by_product(selected_tipo_produto, selected_marca)
+    if receita_produto_filtrado_df is None:
+        return {'data': [], 'layout': {'title': f'Nenhum dado para {selected_tipo_produto} - {selected_marca}'}}
+
+    with callback_stage('figuras'):
+        fig_cascata = category_figure('Produto', REVENUE_LABEL, category_axis={'categoryorder': 'total descending'},
+                                      title={'text': f"Receita por Produto: {selected_tipo_produto} - {selected_marca}"})
+        fig_cascata = fill_figure(fig_cascata, [category_trace(receita_produto_filtrado_df['Produto'],
+                                                               receita_produto_filtrado_df['Receita'])])
+    return fig_cascata
 
 @app.callback(
     Output('graph-cascata-resultado', 'figure'),
     [Input('dropdown-cascata-tipo-produto', 'value'),
-     Input('dropdown-cascata-marca', 'value')]
+     Input('dropdown-cascata-marca', 'value'),
+     Input('store-versao-dados', 'data')]
 )
-def update_cascata_graph(selected_tipo_produto, selected_marca):
-    if df_global.empty or not selected_tipo_produto or not selected_marca:
+@instrumented('update_cascata_graph')
+def update_cascata_graph(selected_tipo_produto, selected_marca, versao_dados=None):
+    ds = current_dataset()
+    if ds is None:
+        return {'data': [], 'layout': {'title': 'Carregando dados...'}}
+    if ds.df.empty or not selected_tipo_produto or not selected_marca:
         return {'data': [], 'layout': {'title': 'Selecione Tipo de Produto e Marca para ver os dados'}}
+    return cascade_figure(ds, selected_tipo_produto, selected_marca)
 
-    dff_cascata = df_global[
-        (df_global['Tipo do Produto'] == selected_tipo_produto) &
-        (df_global['Marca'] == selected_marca)
-    ]
 
-    if dff_cascata.empty:
-        return {'data': [], 'layout': {'title': f'Nenhum dado para {selected_tipo_produto} - {selected_marca}'}}
+def search_dropdown_options(dropdown_id, search_value, selected):
+    """Opções de um dropdown pesquisável: ALL_VALUES, a seleção atual e as sugestões da busca."""
+    ds = current_dataset()
+    if not search_value or ds is None:
+        raise PreventUpdate # Mantém as opções atuais ao limpar o texto da busca
+    options = get_selected_options(selected)
+    current = {option['value'] for option in options}
+    with callback_stage('busca'):
+        matches = ds.search_indexes[SEARCHABLE_DROPDOWNS[dropdown_id]].search(search_value)
+    options.extend({'label': str(v), 'value': str(v)} for v in matches if str(v) not in current)
+    return options
 
-    receita_produto_filtrado_df = dff_cascata.groupby('Produto')['Receita'].sum().reset_index().sort_values(by='Receita', ascending=False)
-    
-    fig_cascata = px.bar(receita_produto_filtrado_df, x='Produto', y='Receita',
-                         labels={'Produto': 'Produto', 'Receita': 'Receita Total (R$)'},
-                         title=f"Receita por Produto: {selected_tipo_produto} - {selected_marca}")
-    fig_cascata.update_layout(xaxis={'categoryorder':'total descending'})
-    return fig_cascata
+@app.callback(
+    Output('dropdown-produto', 'options'),
+    [Input('dropdown-produto', 'search_value')],
+    [State('dropdown-produto', 'value')]
+)
+@instrumented('search_options_produto')
+def search_options_produto(search_value, selected):
+    return search_dropdown_options('dropdown-produto', search_value, selected)
+
+@app.callback(
+    Output('dropdown-cliente', 'options'),
+    [Input('dropdown-cliente', 'search_value')],
+    [State('dropdown-cliente', 'value')]
+)
+@instrumented('search_options_cliente')
+def search_options_cliente(search_value, selected):
+    return search_dropdown_options('dropdown-cliente', search_value, selected)
 
 
 if __name__ == '__main__':
-    if df_global.empty:
-        print("Não foi possível carregar os dados. O dashboard não será iniciado.")
+    parser = argparse.ArgumentParser(description="Dashboard de Vendas Interativo")
+    parser.add_argument('--build-snapshot', action='store_true',
+                        help="Gera/valida o snapshot colunar dos dados e sai (útil no deploy)")
+    parser.add_argument('--force', action='store_true',
+                        help="Com --build-snapshot, regrava o snapshot mesmo que esteja atualizado")
+    args = parser.parse_args()
+
+    if args.build_snapshot:
+        if not SNAPSHOT_DIR:
+            parser.error("DASH_SNAPSHOT_DIR está vazio; o snapshot está desativado.")
+        df_snapshot = load_data(force_rebuild=args.force)
+        if df_snapshot.empty:
+            raise SystemExit("Não foi possível carregar os dados para gerar o snapshot.")
+        if SHARED_DATA:
+            Dataset(df_snapshot) # Grava também o cubo e os índices de busca que os workers vão mapear
+        print(f"Snapshot {df_snapshot.attrs['versao']} pronto em {SNAPSHOT_DIR} ({len(df_snapshot)} linhas).")
     else:
-        print("Dados carregados com sucesso. Iniciando o dashboard...")
+        start_background_load()
+        print("Iniciando o dashboard; os dados são carregados em segundo plano (acompanhe em /readyz)...")
         app.run(debug=True) # Alterado de app.run_server para app.run
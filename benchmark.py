@@ -0,0 +1,418 @@
+"""
+Benchmark do dashboard com dados sintéticos.
+
+Gera CSVs com o mesmo esquema de 'Base Vendas', 'Cadastro Clientes', 'Cadastro Produtos'
+e 'Cadastro Lojas' e, para cada escala, mede num processo separado (para que o pico de
+RSS seja só daquela escala):
+
+- tempo de load_data() a partir dos CSVs e a partir do snapshot, e da carga completa do app;
+- pico de RSS do processo;
+- percentis de latência de apply_filters e das callbacks, numa matriz de filtros;
+- tamanho das respostas das callbacks principais (figuras completas, dash.Patch e tabela).
+
+As callbacks são chamadas sem o cache de resultados, então os tempos são sempre de cálculo.
+Os resultados vão para um JSON que pode ser comparado com o de outra versão (--comparar).
+
+Uso:
+    python benchmark.py                                   # 10^5, 10^6 e 10^7 linhas
+    python benchmark.py --linhas 100000 1000000 --cardinalidade baixa real alta
+    python benchmark.py --saida depois.json --comparar antes.json
+    python benchmark.py --comparar antes.json depois.json # só compara, sem medir
+"""
+import argparse
+import datetime
+import inspect
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from plotly.io.json import to_json_plotly
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+ALL_VALUES = "TODOS"
+
+# Cardinalidades relativas ao número de vendas (clientes) ou absolutas (demais).
+# 'real' reproduz as proporções dos CSVs do repositório (~55 mil vendas, ~18 mil clientes).
+CARDINALITY_PROFILES = {
+    'baixa': {'clientes': 0.01, 'produtos': 60, 'marcas': 8, 'tipos': 4, 'lojas': 20},
+    'real': {'clientes': 0.33, 'produtos': 300, 'marcas': 30, 'tipos': 11, 'lojas': 300},
+    'alta': {'clientes': 0.8, 'produtos': 5000, 'marcas': 400, 'tipos': 40, 'lojas': 3000},
+}
+YEARS = (2020, 2021, 2022)
+PERCENTILES = (50, 90, 99)
+
+
+# --- Gerador de dados sintéticos ---
+
+def _skewed_choice(rng, n_values, size, exponent=0.8):
+    """Índices em [0, n_values) com popularidade decrescente (tipo Zipf), como nas vendas reais."""
+    weights = 1.0 / np.arange(1, n_values + 1) ** exponent
+    return rng.choice(n_values, size=size, p=weights / weights.sum())
+
+
+def _names(prefix, n):
+    return np.array([f"{prefix} {i}" for i in range(n)], dtype=object)
+
+
+def generate_dataset(directory, n_rows, profile='real', seed=0):
+    """
+    Grava em directory os três cadastros e um 'Base Vendas - AAAA.csv' por ano de YEARS.
+
+    Returns:
+        dict: As cardinalidades efetivamente usadas.
+    """
+    rng = np.random.default_rng(seed)
+    spec = CARDINALITY_PROFILES[profile]
+    n_clients = max(10, int(n_rows * spec['clientes']))
+    n_products, n_brands, n_types, n_stores = spec['produtos'], spec['marcas'], spec['tipos'], spec['lojas']
+    os.makedirs(directory, exist_ok=True)
+
+    first_names = _names('NOME', max(10, n_clients // 3))
+    last_names = _names('SOBRENOME', max(10, n_clients // 2))
+    client_ids = np.arange(11000, 11000 + n_clients)
+    pd.DataFrame({
+        'ID Cliente': client_ids,
+        'Primeiro Nome': first_names[rng.integers(0, len(first_names), n_clients)],
+        'Sobrenome': last_names[rng.integers(0, len(last_names), n_clients)],
+        'Email': [f"cliente{i}@exemplo.com" for i in client_ids],
+        'Genero': rng.choice(['M', 'F'], n_clients),
+        'Data Nascimento': '1/1/1980',
+        'Estado Civil': rng.choice(['C', 'S'], n_clients),
+        'Num Filhos': rng.integers(0, 5, n_clients),
+        'Nivel Escolar': 'Superior Completo',
+        'Documento': rng.integers(10**8, 10**10, n_clients),
+        '': '', ' ': '', # Colunas vazias do arquivo real
+    }).to_csv(os.path.join(directory, 'Cadastro Clientes.csv'), index=False)
+
+    # Cada marca atende a poucos tipos, como no cadastro real (Logitech: Mouse, Teclado, ...)
+    product_brand = _skewed_choice(rng, n_brands, n_products, exponent=0.5)
+    brand_types = rng.integers(0, n_types, size=(n_brands, 3))
+    product_type = brand_types[product_brand, rng.integers(0, 3, n_products)]
+    pd.DataFrame({
+        'SKU': [f"HL{i}" for i in range(1, n_products + 1)],
+        'Produto': _names('Produto', n_products),
+        'Marca': _names('Marca', n_brands)[product_brand],
+        'Tipo do Produto': _names('Tipo', n_types)[product_type],
+        'Preço Unitario': rng.uniform(5, 2000, n_products).round(2),
+        'Custo Unitario': rng.uniform(1, 500, n_products).round(2),
+        'Observação': '',
+    }).to_csv(os.path.join(directory, 'Cadastro Produtos.csv'), index=False)
+
+    pd.DataFrame({
+        'ID Loja': np.arange(1, n_stores + 1),
+        'Nome da Loja': [f"Loja {i} No.{i % 7 + 1}" for i in range(1, n_stores + 1)],
+        'Quantidade Colaboradores': rng.integers(5, 50, n_stores),
+        'Tipo': rng.choice(['Física', 'Online'], n_stores),
+        'id Localidade': rng.integers(1, 40, n_stores),
+        'Gerente Loja': _names('Gerente', n_stores),
+        'Documento Gerente': rng.integers(10**8, 10**9, n_stores),
+    }).to_csv(os.path.join(directory, 'Cadastro Lojas.csv'), index=False)
+
+    order = 0
+    for year, n_year in zip(YEARS, np.diff(np.linspace(0, n_rows, len(YEARS) + 1).astype(int))):
+        days = pd.date_range(f"{year}-01-01", f"{year}-12-31", freq='D')
+        # Mesmo formato de data dos arquivos reais (D/M/AAAA, sem zeros à esquerda)
+        day_labels = np.array([f"{d.day}/{d.month}/{d.year}" for d in days], dtype=object)
+        pd.DataFrame({
+            'Data da Venda': day_labels[np.sort(rng.integers(0, len(days), n_year))],
+            'Ordem de Compra': [f"SO{i}" for i in range(order, order + n_year)],
+            'SKU': [f"HL{i + 1}" for i in _skewed_choice(rng, n_products, n_year)],
+            'ID Cliente': client_ids[_skewed_choice(rng, n_clients, n_year, exponent=0.3)],
+            'Qtd Vendida': rng.integers(1, 4, n_year),
+            'ID Loja': rng.integers(1, n_stores + 1, n_year),
+        }).to_csv(os.path.join(directory, f"Base Vendas - {year}.csv"), index=False)
+        order += n_year
+
+    return {'clientes': n_clients, 'produtos': n_products, 'marcas': n_brands, 'tipos': n_types, 'lojas': n_stores}
+
+
+# --- Medição (executada num subprocesso por escala) ---
+
+def _peak_rss_mb():
+    # ru_maxrss vem em KiB no Linux e em bytes no macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _summary(samples):
+    """Percentis, média e máximo (em ms) de uma lista de durações em segundos."""
+    ms = np.asarray(samples) * 1000
+    summary = {f"p{p}_ms": round(float(np.percentile(ms, p)), 3) for p in PERCENTILES}
+    summary.update(media_ms=round(float(ms.mean()), 3), max_ms=round(float(ms.max()), 3), amostras=len(ms))
+    return summary
+
+
+def filter_matrix(ds, type_brands, seed=0):
+    """Seleções (produto, loja, cliente, marca, tipo[, início, fim, granularidade]) representativas do uso do dashboard."""
+    rng = np.random.default_rng(seed)
+    categories = ds.filter_index.categories
+    tipo = str(type_brands['Tipo do Produto'].iloc[0])
+    marcas_do_tipo = type_brands.loc[type_brands['Tipo do Produto'] == tipo, 'Marca'].astype(str).head(2).tolist()
+
+    def pick(col, k):
+        values = categories[col]
+        return [str(v) for v in rng.choice(values, size=min(k, len(values)), replace=False)]
+
+    todos = [ALL_VALUES]
+    # Janelas de período relativas à última venda: último mês, últimos 6 meses e um único dia
+    last = pd.Timestamp(ds.time_index.dates[-1])
+    last_month = (last - pd.offsets.MonthBegin(1)).strftime('%Y-%m-%d'), last.strftime('%Y-%m-%d')
+    six_months = (last - pd.DateOffset(months=6)).strftime('%Y-%m-%d'), last.strftime('%Y-%m-%d')
+    one_day = (last - pd.Timedelta(days=45)).strftime('%Y-%m-%d')
+    return {
+        'todos': (todos, todos, todos, todos, todos),
+        'um_cliente': (todos, todos, pick('Nome Completo', 1), todos, todos),
+        'uma_loja': (todos, pick('Nome da Loja', 1), todos, todos, todos),
+        'multi_marca': (todos, todos, todos, pick('Marca', 3), todos),
+        'tipo_e_marcas': (todos, todos, todos, marcas_do_tipo, [tipo]),
+        'produtos_e_lojas': (pick('Produto', 10), pick('Nome da Loja', 20), todos, todos, todos),
+        'cliente_e_marca': (todos, todos, pick('Nome Completo', 5), pick('Marca', 5), todos),
+        'ultimo_mes': (todos, todos, todos, todos, todos, *last_month, 'dia'),
+        'seis_meses_mes_inteiro': (todos, todos, todos, todos, todos, *six_months, 'mes'),
+        'um_dia_e_marca': (todos, todos, todos, pick('Marca', 3), todos, one_day, one_day, 'dia'),
+    }
+
+
+def _time_calls(func, cases, repeats):
+    """Executa func(*args) para cada caso: uma chamada de aquecimento e repeats medidas."""
+    samples, per_case = [], {}
+    for name, args in cases.items():
+        func(*args)
+        durations = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            func(*args)
+            durations.append(time.perf_counter() - start)
+        samples += durations
+        per_case[name] = round(float(np.median(durations)) * 1000, 3)
+    summary = _summary(samples)
+    summary['mediana_por_caso_ms'] = per_case
+    return summary
+
+
+def _with_period(selection):
+    """Caso de filter_matrix com o período explícito (início, fim, granularidade)."""
+    return tuple(selection) + (None, None, 'dia')[len(selection) - 5:]
+
+
+def _response_bytes(outputs):
+    return len(to_json_plotly(list(outputs)).encode('utf-8'))
+
+
+def measure(directory, repeats, seed=0):
+    """Mede carga, memória e latência das callbacks com os CSVs de directory."""
+    os.chdir(directory)
+    os.environ['DASH_SNAPSHOT_DIR'] = os.path.join(directory, '.snapshot_dados')
+    os.environ['DASH_REFRESH_INTERVAL'] = '0'
+    os.environ['DASH_CACHE_PATH'] = ''
+    sys.path.insert(0, REPO_DIR)
+
+    result = {}
+    start = time.perf_counter()
+    import app_dash
+    result['import_s'] = round(time.perf_counter() - start, 3)
+
+    start = time.perf_counter()
+    df = app_dash.load_data(force_rebuild=True)
+    result['carga_csv_s'] = round(time.perf_counter() - start, 3)
+    result['linhas_carregadas'] = len(df)
+    del df
+    start = time.perf_counter()
+    app_dash.load_data()
+    result['carga_snapshot_s'] = round(time.perf_counter() - start, 3)
+
+    # Carga do app: snapshot mais índices e cubo, como um worker recém-iniciado
+    start = time.perf_counter()
+    ds = app_dash.wait_for_dataset()
+    result['carga_app_s'] = round(time.perf_counter() - start, 3)
+    result['pico_rss_carga_mb'] = _peak_rss_mb()
+
+    # Sem o cache de resultados: mede o cálculo de cada chamada. As callbacks são
+    # desembrulhadas e as funções memoizadas que elas chamam não guardam nada
+    app_dash.result_cache.max_entries = 0
+    main_graphs = inspect.unwrap(app_dash.update_main_graphs)
+    tabela = inspect.unwrap(app_dash.update_tabela_marca)
+    cascata = inspect.unwrap(app_dash.update_cascata_graph)
+    marcas = inspect.unwrap(app_dash.update_marcas_dropdown)
+    # Pares (tipo, marca) existentes, dos mais vendidos para os menos
+    type_brands = ds.df.groupby(['Tipo do Produto', 'Marca'], observed=True).size().sort_values(ascending=False)
+    type_brands = type_brands.reset_index()[['Tipo do Produto', 'Marca']].astype(str)
+    selections = filter_matrix(ds, type_brands, seed)
+    tipos = type_brands['Tipo do Produto'].drop_duplicates().head(5).tolist()
+    pairs = type_brands.head(5).itertuples(index=False)
+
+    result['callbacks'] = {
+        'apply_filters': _time_calls(lambda *sel: app_dash.apply_filters(ds, *sel), selections, repeats),
+        'update_main_graphs': _time_calls(lambda *sel: main_graphs(*sel, versao_dados=ds.version), selections, repeats),
+        # Navegador já com os esqueletos da versão: a resposta é só dash.Patch com os vetores
+        'update_main_graphs_patch': _time_calls(lambda *sel: main_graphs(*sel, versao_dados=ds.version,
+                                                                         versao_figuras=ds.version),
+                                                selections, repeats),
+        'update_tabela_marca': _time_calls(lambda *sel: tabela(*_with_period(sel), ds.version, 0, 10, []),
+                                           selections, repeats),
+        'update_marcas_dropdown': _time_calls(marcas, {tipo: (tipo,) for tipo in tipos}, repeats),
+        'update_cascata_graph': _time_calls(lambda tipo, marca: cascata(tipo, marca, ds.version),
+                                            {f"{tipo}/{marca}": (tipo, marca) for tipo, marca in pairs}, repeats),
+    }
+    # Tamanho das respostas (JSON serializado como o Dash faz), mediana sobre a matriz de filtros
+    responses = {
+        'update_main_graphs': lambda *sel: main_graphs(*sel, versao_dados=ds.version),
+        'update_main_graphs_patch': lambda *sel: main_graphs(*sel, versao_dados=ds.version, versao_figuras=ds.version),
+        'update_tabela_marca': lambda *sel: tabela(*_with_period(sel), ds.version, 0, 10, []),
+    }
+    result['bytes_resposta'] = {name: int(np.median([_response_bytes(func(*args)) for args in selections.values()]))
+                                for name, func in responses.items()}
+    result['pico_rss_mb'] = _peak_rss_mb()
+    return result
+
+
+def run_scale(n_rows, profile, repeats, data_root, seed):
+    """Gera (ou reaproveita) os dados de uma escala e mede num subprocesso."""
+    directory = os.path.join(data_root, f"{profile}_{n_rows}_{seed}")
+    marker = os.path.join(directory, 'cardinalidades.json')
+    if os.path.exists(marker):
+        with open(marker, encoding='utf-8') as f:
+            cardinalities = json.load(f)
+        generation_s = None
+    else:
+        start = time.perf_counter()
+        cardinalities = generate_dataset(directory, n_rows, profile, seed)
+        generation_s = round(time.perf_counter() - start, 3)
+        with open(marker, 'w', encoding='utf-8') as f:
+            json.dump(cardinalities, f)
+
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--medir', directory,
+                           '--repeticoes', str(repeats), '--seed', str(seed)],
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Medição de {n_rows} linhas ({profile}) falhou:\n{proc.stderr}")
+    result = {'linhas': n_rows, 'cardinalidade': profile, **cardinalities, 'geracao_s': generation_s}
+    result.update(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return result
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- Comparação entre versões ---
+
+def _flatten(result):
+    """Métricas comparáveis de uma escala: {nome: valor}, menores são melhores."""
+    metrics = {key: result[key] for key in ('carga_csv_s', 'carga_snapshot_s', 'carga_app_s', 'pico_rss_mb')
+               if result.get(key) is not None}
+    for callback, n_bytes in result.get('bytes_resposta', {}).items():
+        metrics[f"{callback}.bytes"] = n_bytes
+    for callback, summary in result.get('callbacks', {}).items():
+        for p in PERCENTILES:
+            metrics[f"{callback}.p{p}_ms"] = summary[f"p{p}_ms"]
+    return metrics
+
+
+def compare(before, after, threshold):
+    """
+    Imprime a razão depois/antes de cada métrica das escalas presentes nos dois arquivos.
+
+    Returns:
+        list: Métricas que pioraram mais que threshold (ex.: 0.2 = 20%).
+    """
+    index = {(r['linhas'], r['cardinalidade']): r for r in before['resultados']}
+    regressions = []
+    print(f"Comparando {before['meta'].get('git')} -> {after['meta'].get('git')}")
+    for result in after['resultados']:
+        key = (result['linhas'], result['cardinalidade'])
+        if key not in index:
+            continue
+        old_metrics = _flatten(index[key])
+        print(f"\n{key[0]} linhas, cardinalidade {key[1]}:")
+        for name, value in _flatten(result).items():
+            old = old_metrics.get(name)
+            if not old:
+                continue
+            ratio = value / old
+            flag = ''
+            if ratio > 1 + threshold:
+                flag = '  <-- regressão'
+                regressions.append((key, name, old, value))
+            print(f"  {name:40s} {old:>12.3f} -> {value:>12.3f}  ({ratio:.2f}x){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do dashboard com dados sintéticos")
+    parser.add_argument('--linhas', type=int, nargs='+', default=[10**5, 10**6, 10**7],
+                        help="Números de vendas a gerar (padrão: 10^5 10^6 10^7)")
+    parser.add_argument('--cardinalidade', nargs='+', default=['real'], choices=sorted(CARDINALITY_PROFILES),
+                        help="Perfis de cardinalidade de clientes, produtos e lojas")
+    parser.add_argument('--repeticoes', type=int, default=5, help="Medições por caso de filtro")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dados', default='',
+                        help="Diretório onde os dados gerados são guardados e reaproveitados (padrão: temporário)")
+    parser.add_argument('--saida', default='benchmark_resultados.json', help="Arquivo JSON de resultados")
+    parser.add_argument('--comparar', nargs='+', metavar='JSON',
+                        help="Resultados anteriores para comparar; com dois arquivos, só compara e sai")
+    parser.add_argument('--limite', type=float, default=0.2,
+                        help="Piora relativa considerada regressão na comparação (padrão: 0.2)")
+    parser.add_argument('--medir', help=argparse.SUPPRESS) # Uso interno: mede um diretório no subprocesso
+    args = parser.parse_args()
+
+    if args.medir:
+        print(json.dumps(measure(args.medir, args.repeticoes, args.seed)))
+        return 0
+
+    if args.comparar and len(args.comparar) == 2:
+        with open(args.comparar[0], encoding='utf-8') as f_before, open(args.comparar[1], encoding='utf-8') as f_after:
+            return 1 if compare(json.load(f_before), json.load(f_after), args.limite) else 0
+
+    data_root = args.dados or tempfile.mkdtemp(prefix='bench_dash_')
+    report = {
+        'meta': {
+            'data': datetime.datetime.now().isoformat(timespec='seconds'),
+            'git': _git_revision(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'plataforma': platform.platform(),
+            'repeticoes': args.repeticoes,
+            'seed': args.seed,
+        },
+        'resultados': [],
+    }
+    try:
+        for n_rows in args.linhas:
+            for profile in args.cardinalidade:
+                print(f"Medindo {n_rows} linhas, cardinalidade {profile}...", flush=True)
+                result = run_scale(n_rows, profile, args.repeticoes, data_root, args.seed)
+                report['resultados'].append(result)
+                callbacks = ', '.join(f"{name} p50={summary['p50_ms']:.1f}ms"
+                                      for name, summary in result['callbacks'].items())
+                print(f"  carga CSV {result['carga_csv_s']}s, snapshot {result['carga_snapshot_s']}s, "
+                      f"pico RSS {result['pico_rss_mb']} MB; {callbacks}", flush=True)
+                # Grava a cada escala para não perder resultados de execuções longas
+                with open(args.saida, 'w', encoding='utf-8') as f:
+                    json.dump(report, f, ensure_ascii=False, indent=1)
+    finally:
+        if not args.dados:
+            shutil.rmtree(data_root, ignore_errors=True)
+    print(f"Resultados em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar[0], encoding='utf-8') as f:
+            return 1 if compare(json.load(f), report, args.limite) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
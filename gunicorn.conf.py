@@ -0,0 +1,10 @@
+# Configuração do gunicorn, lida automaticamente do diretório de trabalho:
+#   gunicorn app_dash:server --workers 4 [--preload]
+
+
+def post_worker_init(worker):
+    # Cada worker começa a carregar os dados assim que sobe (com ou sem --preload), em vez de
+    # esperar a sua primeira requisição: um worker que ainda não recebeu tráfego já está
+    # carregando (ou pronto) quando o balanceador o consulta em /readyz
+    import app_dash
+    app_dash.start_background_load()
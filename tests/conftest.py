@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# app_dash.py e benchmark.py ficam na raiz do repositório
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark # noqa: E402
+
+
+@pytest.fixture
+def sales_dir(tmp_path, monkeypatch):
+    """Diretório de trabalho com os CSVs sintéticos (3 mil vendas, um arquivo por ano de 2020 a 2022)."""
+    benchmark.generate_dataset(str(tmp_path), 3000, profile='real', seed=1)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
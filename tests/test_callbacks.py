@@ -0,0 +1,99 @@
+"""Callbacks com troca do dataset (refresh) no meio da requisição."""
+import inspect
+
+import pytest
+import numpy as np
+import pandas as pd
+from plotly.io.json import to_json_plotly
+
+import app_dash
+from app_dash import DATE_COLUMN, Dataset, apply_filters, load_data
+
+NO_FILTERS = (None, None, None, None, None, None, None, 'dia')
+
+
+@pytest.fixture
+def datasets(sales_dir, monkeypatch):
+    """Dataset em uso e a versão seguinte, na qual um Tipo do Produto deixou de ter vendas."""
+    old = Dataset(load_data(snapshot_dir=''))
+    df = old.df[old.df['Tipo do Produto'] != old.product_types[0]].reset_index(drop=True)
+    df.attrs = dict(old.df.attrs, versao='nova')
+    new = Dataset(df)
+    monkeypatch.setattr(app_dash, '_dataset', old)
+    app_dash.result_cache.clear()
+    return old, new
+
+
+def _swap_on_cache_lookup(monkeypatch, new):
+    """Faz o refresh publicar new entre a leitura do dataset pela callback e o cálculo memoizado."""
+    original = app_dash.result_cache.get
+
+    def swapping(*args, **kwargs):
+        monkeypatch.setattr(app_dash, '_dataset', new)
+        return original(*args, **kwargs)
+    monkeypatch.setattr(app_dash.result_cache, 'get', swapping)
+
+
+def test_main_graphs_use_one_dataset_when_swapped(datasets, monkeypatch):
+    old, new = datasets
+    main_graphs = inspect.unwrap(app_dash.update_main_graphs)
+    expected = to_json_plotly(main_graphs(*NO_FILTERS, old.version, None))
+    app_dash.result_cache.clear()
+
+    _swap_on_cache_lookup(monkeypatch, new)
+    response = main_graphs(*NO_FILTERS, old.version, None)
+    assert response[-1] == old.version
+    assert to_json_plotly(response) == expected
+    assert app_dash.result_cache.stats()['entries'] == 0 # Resultado da versão antiga não é guardado
+
+    # Com a versão nova em uso, os traços são os dela, nos esqueletos dela
+    response = main_graphs(*NO_FILTERS, new.version, None)
+    area = response[4]
+    assert response[-1] == new.version
+    assert [trace['name'] for trace in area['data']] == new.product_types
+
+
+def test_brand_table_uses_one_dataset_when_swapped(datasets, monkeypatch):
+    old, new = datasets
+    tabela = inspect.unwrap(app_dash.update_tabela_marca)
+    expected = tabela(*NO_FILTERS, old.version, 0, 1000, [])
+    app_dash.result_cache.clear()
+
+    _swap_on_cache_lookup(monkeypatch, new)
+    assert tabela(*NO_FILTERS, old.version, 0, 1000, []) == expected
+    assert app_dash.result_cache.stats()['entries'] == 0
+
+
+@pytest.mark.parametrize('refresh_interval, disabled', [(60, False), (0, True)])
+def test_status_keeps_polling_after_load_error(sales_dir, monkeypatch, refresh_interval, disabled):
+    status = inspect.unwrap(app_dash.update_dataset_status)
+    monkeypatch.setattr(app_dash, 'REFRESH_INTERVAL', refresh_interval)
+    monkeypatch.setattr(app_dash, '_dataset', None)
+    monkeypatch.setattr(app_dash, '_load_error', 'arquivo corrompido')
+    response = status(3, None)
+    # Sem verificações no servidor a falha não se resolve sozinha: a página para de consultar
+    assert response[1] is disabled
+    assert response[3] == "Erro ao carregar os dados: arquivo corrompido"
+    if not disabled:
+        assert response[2] == 60000
+
+    # Uma verificação seguinte carrega os dados e a página os recebe
+    ds = Dataset(load_data(snapshot_dir=''))
+    monkeypatch.setattr(app_dash, '_dataset', ds)
+    monkeypatch.setattr(app_dash, '_load_error', None)
+    response = status(4, None)
+    assert response[0] == ds.version and response[3] == ""
+
+
+def test_apply_filters_uses_the_given_dataset(datasets):
+    old, new = datasets # old é o Dataset em uso; new ainda não foi publicado
+    marcas = list(new.filter_index.categories['Marca'][:2])
+    assert apply_filters(new, *NO_FILTERS) is new.df
+    for granularidade in ['dia', 'mes']:
+        filtered = apply_filters(new, None, None, None, marcas, None, '2021-03-15', '2021-08-10', granularidade)
+        start, stop = ('2021-03-15', '2021-08-11') if granularidade == 'dia' else ('2021-03-01', '2021-09-01')
+        dates = new.df[DATE_COLUMN]
+        mask = new.df['Marca'].isin(marcas) & (dates >= pd.Timestamp(start)) & (dates < pd.Timestamp(stop))
+        expected = new.df[mask]
+        assert len(expected) > 0
+        np.testing.assert_array_equal(np.sort(filtered.index.to_numpy()), expected.index.to_numpy())
@@ -0,0 +1,131 @@
+"""
+RevenueCube contra o groupby do pandas que ele substitui: somas por grupo arredondadas
+a 1e-6 e top k como Series.nlargest(keep='first'), com empates e agrupamentos de várias colunas.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from app_dash import BRAND_AGGREGATIONS, FILTER_COLUMNS, MAIN_AGGREGATIONS, FilterIndex, RevenueCube, top_k
+
+REQUESTS = MAIN_AGGREGATIONS + BRAND_AGGREGATIONS + [
+    ('top_mes_tipo', ['MesAno da Venda', 'Tipo do Produto'], 5),
+    ('ano_marca', ['Ano da Venda', 'Marca'], None),
+    ('top_loja_cliente', ['Nome da Loja', 'Nome Completo'], 7),
+]
+
+
+def sales_frame(n_rows=400, seed=0):
+    """Vendas com poucos valores de receita, para que muitos grupos empatem (alguns só após arredondar)."""
+    rng = np.random.default_rng(seed)
+    products = np.array([f"Produto {i:02d}" for i in range(30)])
+    months = pd.period_range('2021-01', '2022-12', freq='M').strftime('%Y-%m').to_numpy()
+    produto = rng.choice(products, n_rows)
+    product_number = np.char.rpartition(produto.astype(str), ' ')[:, 2].astype(int)
+    df = pd.DataFrame({
+        'Produto': produto,
+        'Nome da Loja': rng.choice([f"Loja {i}" for i in range(8)], n_rows),
+        'Nome Completo': rng.choice([f"Cliente {i:02d}" for i in range(60)], n_rows),
+        'Marca': [f"Marca {i % 6}" for i in product_number],
+        'Tipo do Produto': [f"Tipo {i % 6 % 3}" for i in product_number],
+        'MesAno da Venda': rng.choice(months, n_rows),
+        # 0.1 + 0.2 != 0.3 em ponto flutuante: o arredondamento a 1e-6 faz esses grupos empatarem
+        'Receita': rng.choice([0.1, 0.2, 0.3, 10.0, 19.99], n_rows),
+        'Qtd Vendida': rng.integers(1, 4, n_rows),
+    })
+    df['Ano da Venda'] = df['MesAno da Venda'].str[:4].astype(int)
+    return df
+
+
+def expected_aggregate(df, by, k, selections):
+    """O cálculo com pandas: filtros com isin, groupby(...).sum() e nlargest(k, keep='first')."""
+    mask = np.ones(len(df), dtype=bool)
+    for col, selected in selections.items():
+        if selected is not None:
+            mask &= df[col].isin(selected).to_numpy()
+    sums = df[mask].groupby(by)[['Receita', 'Qtd Vendida']].sum()
+    sums['Receita'] = sums['Receita'].round(6)
+    if k is not None:
+        sums = sums.loc[sums['Receita'].nlargest(k, keep='first').index]
+    return sums
+
+
+def _selections(df):
+    yield {}
+    yield {'Marca': ['Marca 1', 'Marca 4']}
+    yield {'Nome da Loja': ['Loja 0', 'Loja 3'], 'Tipo do Produto': ['Tipo 2']}
+    yield {'Produto': list(df['Produto'].unique()[:4]), 'Nome Completo': list(df['Nome Completo'].unique()[:20])}
+    yield {'Marca': ['Marca Inexistente']}
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_aggregate_many_matches_pandas_groupby(seed):
+    df = sales_frame(seed=seed)
+    cube = RevenueCube(df, FilterIndex(df))
+    for selected in _selections(df):
+        selections = {col: None for col in FILTER_COLUMNS}
+        selections.update(selected)
+        results = cube.aggregate_many(REQUESTS, selections)
+        for name, by, k in REQUESTS:
+            result, expected = results[name], expected_aggregate(df, by, k, selections)
+            context = (name, selected)
+            assert result.index.tolist() == expected.index.tolist(), context
+            np.testing.assert_allclose(result['Receita'].to_numpy(), expected['Receita'].to_numpy(), rtol=0,
+                                       atol=1e-9, err_msg=str(context))
+            np.testing.assert_array_equal(result['Qtd Vendida'].to_numpy(), expected['Qtd Vendida'].to_numpy())
+            assert result['Qtd Vendida'].dtype == df['Qtd Vendida'].dtype
+
+
+def test_ties_are_broken_by_key_order():
+    df = sales_frame()
+    cube = RevenueCube(df, FilterIndex(df))
+    top = cube.aggregate_many([('top', ['Nome Completo'], 10)], {col: None for col in FILTER_COLUMNS})['top']
+    revenue = top['Receita'].to_numpy()
+    assert len(set(revenue)) < len(revenue) # A amostra tem empates no top 10
+    for value in set(revenue):
+        tied = top.index[revenue == value].tolist()
+        assert tied == sorted(tied)
+
+
+@pytest.mark.parametrize('k', [1, 3, 5, 8, 12])
+def test_top_k_matches_nlargest_keep_first(k):
+    values = np.array([3.0, 1.0, 3.0, 2.0, 5.0, 2.0, 3.0, 0.0, 5.0, 1.0])
+    expected = pd.Series(values).nlargest(k, keep='first').index.to_numpy()
+    np.testing.assert_array_equal(top_k(values, k), expected)
+
+
+@pytest.fixture
+def unique_calls(monkeypatch):
+    """Chamadas de np.unique com return_inverse, que só o caminho de chaves esparsas faz."""
+    calls = []
+    original = np.unique
+
+    def spy(*args, **kwargs):
+        if kwargs.get('return_inverse'):
+            calls.append(len(args[0]))
+        return original(*args, **kwargs)
+    monkeypatch.setattr(np, 'unique', spy)
+    return calls
+
+
+@pytest.mark.parametrize('by, k, sparse', [
+    (['Produto', 'Nome Completo'], None, True), # 30 x 60 chaves possíveis para no máximo 300 linhas
+    (['Produto', 'Nome Completo', 'MesAno da Venda'], 10, True),
+    (['Tipo do Produto', 'Nome da Loja'], None, False), # 3 x 8 chaves: bincount direto
+    (['Tipo do Produto'], 2, False),
+])
+def test_sparse_and_dense_keys_match_pandas_groupby(unique_calls, by, k, sparse):
+    df = sales_frame(n_rows=300)
+    cube = RevenueCube(df, FilterIndex(df))
+    for selected in _selections(df):
+        selections = {col: None for col in FILTER_COLUMNS}
+        selections.update(selected)
+        unique_calls.clear()
+        result = cube.aggregate_many([('resultado', by, k)], selections)['resultado']
+        if not selected:
+            # Com filtros, até poucas chaves podem superar as linhas restantes e ser compactadas
+            assert bool(unique_calls) == sparse
+        expected = expected_aggregate(df, by, k, selections)
+        assert result.index.tolist() == expected.index.tolist(), selected
+        np.testing.assert_allclose(result['Receita'].to_numpy(), expected['Receita'].to_numpy(), rtol=0, atol=1e-9)
+        np.testing.assert_array_equal(result['Qtd Vendida'].to_numpy(), expected['Qtd Vendida'].to_numpy())
@@ -0,0 +1,179 @@
+"""
+Ingestão incremental (Dataset.ingest) contra a carga do zero, sobre dados sintéticos
+do benchmark, e as estruturas que ela estende: FilterIndex, RevenueCube e o snapshot.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import app_dash
+from app_dash import (CUBE_ROW_COUNT, DATE_COLUMN, FILTER_COLUMNS, Dataset, FilterIndex, RevenueCube,
+                      TimeIndex, load_data, load_snapshot, normalize_date_range, source_fingerprints)
+
+GROUPINGS = [['Ano da Venda'], ['MesAno da Venda'], ['Nome da Loja'], ['Marca'], ['Produto', 'Marca'],
+             ['Nome Completo'], ['Tipo do Produto', 'MesAno da Venda']]
+
+
+def _selections(ds):
+    categories = ds.filter_index.categories
+    yield {}
+    yield {'Marca': [categories['Marca'][0]]}
+    yield {'Nome da Loja': list(categories['Nome da Loja'][:3]), 'Tipo do Produto': [categories['Tipo do Produto'][1]]}
+    yield {'Produto': list(categories['Produto'][:5])}
+
+
+def assert_same_cube(cube, fresh, selections):
+    assert cube.categories.keys() == fresh.categories.keys()
+    for col, categories in fresh.categories.items():
+        assert cube.categories[col].equals(categories), col
+    np.testing.assert_array_equal(cube.years, fresh.years)
+    np.testing.assert_array_equal(cube.month_year_code, fresh.month_year_code)
+    sizes = lambda c: sorted((sorted(dims), len(columns[CUBE_ROW_COUNT])) for dims, columns in c.rollups)
+    assert sizes(cube) == sizes(fresh) # Grupos esvaziados pelo delta negativo saíram
+    for selected in selections:
+        active = {col: None for col in FILTER_COLUMNS}
+        active.update(selected)
+        for by in GROUPINGS:
+            pd.testing.assert_frame_equal(cube.aggregate(by, active), fresh.aggregate(by, active), obj=str((by, selected)))
+
+
+def assert_same_dataset(ds, fresh):
+    assert ds.version == fresh.version
+    assert ds.sales_rows == fresh.sales_rows
+    pd.testing.assert_frame_equal(ds.df, fresh.df)
+    for col in FILTER_COLUMNS:
+        assert ds.filter_index.categories[col].equals(fresh.filter_index.categories[col]), col
+        np.testing.assert_array_equal(ds.filter_index.codes[col], fresh.filter_index.codes[col])
+    assert ds.dropdown_options == fresh.dropdown_options
+    assert (ds.time_index.order is None) == (fresh.time_index.order is None)
+    np.testing.assert_array_equal(ds.time_index.dates, fresh.time_index.dates)
+    assert_same_cube(ds.revenue_cube, fresh.revenue_cube, _selections(fresh))
+    assert ds.hierarchy.brand_options == fresh.hierarchy.brand_options
+    assert ds.hierarchy.product_ranges == fresh.hierarchy.product_ranges
+    assert list(ds.hierarchy.products) == list(fresh.hierarchy.products)
+    np.testing.assert_allclose(ds.hierarchy.revenue, fresh.hierarchy.revenue)
+
+
+def _shift_year(df, year, new_year):
+    df = df.copy()
+    df['Data da Venda'] = df['Data da Venda'].str.replace(str(year), str(new_year))
+    return df
+
+
+def _add_file():
+    _shift_year(pd.read_csv('Base Vendas - 2022.csv'), 2022, 2023).to_csv('Base Vendas - 2023.csv', index=False)
+
+
+def _shrink_file():
+    df = pd.read_csv('Base Vendas - 2021.csv')
+    df.iloc[: len(df) // 2].to_csv('Base Vendas - 2021.csv', index=False)
+
+
+def _replace_file():
+    # Poucas linhas no lugar de um ano inteiro: meses e valores somem do dataset
+    pd.read_csv('Base Vendas - 2022.csv').iloc[:10].to_csv('Base Vendas - 2022.csv', index=False)
+
+
+def _overlapping_file():
+    # Arquivo novo no meio do período: os blocos são reordenados por sales_block_key
+    df = _shift_year(pd.read_csv('Base Vendas - 2022.csv'), 2022, 2021).iloc[:200]
+    df.sort_values('Data da Venda', key=lambda s: pd.to_datetime(s, dayfirst=True)).to_csv(
+        'Base Vendas - 2021b.csv', index=False)
+
+
+@pytest.mark.parametrize('change', [_add_file, _shrink_file, _replace_file, _overlapping_file],
+                         ids=['arquivo novo', 'arquivo encolhido', 'arquivo substituido', 'arquivo sobreposto'])
+def test_ingest_matches_fresh_build(sales_dir, change):
+    ds = Dataset(load_data())
+    change()
+    new = ds.ingest(source_fingerprints(ds.sources))
+    assert new is not None
+    fresh = Dataset(load_data(snapshot_dir=''))
+    # Só o arquivo que começa antes do fim do anterior tira o dataset da ordem de data
+    assert (fresh.time_index.order is not None) == (change is _overlapping_file)
+    assert_same_dataset(new, fresh)
+
+    # O snapshot gravado a partir do anterior (só as linhas novas codificadas) é o de uma carga do zero
+    manifest = app_dash._read_manifest(app_dash.SNAPSHOT_DIR)
+    assert manifest['versao'] == new.version
+    pd.testing.assert_frame_equal(load_snapshot(manifest, app_dash.SNAPSHOT_DIR), fresh.df)
+
+
+def test_ingest_chain_matches_fresh_build(sales_dir):
+    ds = Dataset(load_data())
+    for change in (_add_file, _shrink_file, _replace_file):
+        change()
+        ds = ds.ingest(source_fingerprints(ds.sources))
+    assert_same_dataset(ds, Dataset(load_data(snapshot_dir='')))
+
+
+def test_ingest_falls_back_when_lookup_changes(sales_dir):
+    ds = Dataset(load_data(snapshot_dir=''))
+    assert ds.ingest(source_fingerprints(ds.sources)) is None # Nada mudou
+    lojas = pd.read_csv('Cadastro Lojas.csv')
+    lojas.loc[0, 'Nome da Loja'] = 'Loja Renomeada'
+    lojas.to_csv('Cadastro Lojas.csv', index=False)
+    assert ds.ingest(source_fingerprints(ds.sources)) is None
+
+
+def test_revenue_cube_extend_applies_signed_delta(sales_dir):
+    df = load_data(snapshot_dir='')
+    month = df['MesAno da Venda'].to_numpy()
+    # Sai um mês inteiro e uma amostra de linhas; entram cópias de linhas com a receita alterada
+    removed_rows = (month == month[0]) | (np.arange(len(df)) % 7 == 0)
+    keep = np.flatnonzero(~removed_rows)
+    added = df[month != month[0]].iloc[::11].reset_index(drop=True)
+    added['Receita'] *= 2
+    new_df = pd.concat([df.take(keep), added], ignore_index=True)
+
+    index = FilterIndex(df)
+    new_index = index.extend(new_df, keep, added)
+    cube = RevenueCube(df, index).extend(new_index, added, df[removed_rows])
+    fresh = RevenueCube(new_df, FilterIndex(new_df))
+    assert month[0] not in cube.categories['MesAno da Venda']
+    assert_same_cube(cube, fresh, _selections(Dataset(new_df)))
+
+
+def test_filter_index_extend_remaps_codes():
+    df = pd.DataFrame({'Marca': ['b', 'd', 'b', np.nan], 'Produto': ['p2', 'p1', 'p3', 'p1']})
+    added = pd.DataFrame({'Marca': ['a', 'c', np.nan], 'Produto': ['p4', 'p1', 'p0']})
+    keep = np.array([0, 2, 3]) # 'd' sai do dataset
+    order = np.array([5, 0, 3, 1, 4, 2])
+    new_df = pd.concat([df.take(keep), added], ignore_index=True).take(order).reset_index(drop=True)
+
+    index = FilterIndex(df).extend(new_df, keep, added, order)
+    fresh = FilterIndex(new_df)
+    assert index.codes.keys() == fresh.codes.keys() == {'Marca', 'Produto'}
+    for col in fresh.codes:
+        assert index.categories[col].equals(fresh.categories[col]), col
+        np.testing.assert_array_equal(index.codes[col], fresh.codes[col])
+    assert list(index.categories['Marca']) == ['a', 'b', 'c']
+    assert (index.codes['Marca'] == -1).sum() == 2 # Valores ausentes continuam -1
+
+
+def test_time_index_overlapping_files_fall_back_to_permutation():
+    # Dois blocos (arquivos) que se sobrepõem no tempo
+    dates = pd.to_datetime(['2021-01-01', '2021-01-05', '2021-01-09', '2021-01-03', '2021-01-05', '2021-01-12'])
+    index = TimeIndex(pd.DataFrame({DATE_COLUMN: dates}))
+    assert index.order is not None
+    values = dates.to_numpy()
+    for start, end in [('2021-01-03', '2021-01-05'), ('2021-01-02', None), (None, '2021-01-04'), ('2021-02-01', None)]:
+        rows, window_dates = index.window(normalize_date_range(start, end))
+        lo, hi = normalize_date_range(start, end)
+        expected = np.ones(len(values), dtype=bool)
+        if lo is not None:
+            expected &= values >= lo
+        if hi is not None:
+            expected &= values < hi
+        assert sorted(rows) == list(np.flatnonzero(expected)), (start, end)
+        np.testing.assert_array_equal(window_dates, values[rows])
+        assert (np.diff(window_dates) >= np.timedelta64(0)).all()
+
+
+def test_time_index_sorted_dataset_uses_slices():
+    dates = pd.to_datetime(['2021-01-01', '2021-01-03', '2021-01-03', '2021-01-08'])
+    index = TimeIndex(pd.DataFrame({DATE_COLUMN: dates}))
+    assert index.order is None
+    rows, window_dates = index.window(normalize_date_range('2021-01-02', '2021-01-03'))
+    assert rows == slice(1, 3)
+    assert len(window_dates) == 2
@@ -0,0 +1,104 @@
+"""
+ResultCache: argumentos equivalentes dos dropdowns compartilham o mesmo resultado, que vale
+para a versão do dataset em que foi calculado e é guardado em JSON no cache compartilhado.
+"""
+import pickle
+import sqlite3
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app_dash import ALL_VALUES, ResultCache, canonical_selection, decode_payload, encode_payload
+
+
+@pytest.fixture
+def dataset():
+    """Dataset em uso visto pelo cache; os testes trocam a versão para simular uma atualização."""
+    return SimpleNamespace(version='v1')
+
+
+@pytest.fixture(params=['memoria', 'sqlite'])
+def cache(request, tmp_path, dataset):
+    path = str(tmp_path / 'cache.sqlite') if request.param == 'sqlite' else ''
+    return ResultCache(max_entries=16, path=path, version=lambda: dataset.version)
+
+
+def test_canonical_selection():
+    assert canonical_selection(['b', 'a', 'b']) == ('a', 'b')
+    assert canonical_selection('a') == canonical_selection(['a']) == ('a',)
+    assert canonical_selection([1, '1']) == ('1',)
+    for no_filter in (None, [], '', ALL_VALUES, [ALL_VALUES], ['a', ALL_VALUES]):
+        assert canonical_selection(no_filter) is None, no_filter
+
+
+def test_memoize_shares_equivalent_arguments(cache, dataset):
+    calls = []
+
+    @cache.memoize('teste')
+    def compute(ds, selected_marcas, selected_lojas):
+        calls.append((selected_marcas, selected_lojas))
+        return len(calls)
+
+    assert compute(dataset, ['b', 'a'], None) == 1
+    assert compute(dataset, ['a', 'b', 'a'], []) == 1 # Mesma seleção em outra ordem; [] e None não filtram
+    assert compute(dataset, ['a', 'b'], [ALL_VALUES]) == 1
+    assert compute(dataset, ['a'], None) == 2
+    assert compute(dataset, 'a', ALL_VALUES) == 2
+    assert compute(dataset, ['a'], ['Loja 1']) == 3
+    assert compute(dataset, None, ['a']) == 4 # A posição do argumento faz parte da chave
+    assert len(calls) == 4
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (3, 4, 4)
+
+
+def test_memoize_keys_are_per_dataset_version(cache, dataset):
+    calls = []
+
+    @cache.memoize('teste')
+    def compute(ds, selected):
+        calls.append(selected)
+        return len(calls)
+
+    assert compute(dataset, ['a']) == compute(dataset, ['a']) == 1
+    previous = SimpleNamespace(version=dataset.version)
+    dataset.version = 'v2'
+    assert compute(dataset, ['a']) == 2
+    assert compute(dataset, ['a']) == 2
+    # Callback que ainda tem o Dataset anterior: calcula sem ler nem gravar no cache
+    assert compute(previous, ['a']) == 3
+    assert compute(dataset, ['a']) == 2
+
+
+def test_memoize_names_do_not_collide(cache, dataset):
+    first = cache.memoize('primeira')(lambda ds, selected: 'primeira')
+    second = cache.memoize('segunda')(lambda ds, selected: 'segunda')
+    assert (first(dataset, ['a']), second(dataset, ['a'])) == ('primeira', 'segunda')
+
+
+def test_payload_round_trips_callback_results():
+    table = pd.DataFrame({'Marca': ['A', 'B'], 'Quantidade Vendida Total': [3, 1], 'Receita Total (R$)': [10.25, 0.1]})
+    figure = {'data': [{'type': 'bar', 'x': np.array(['2021', '2022']), 'y': np.arange(2.0)}], 'layout': {}}
+    decoded = decode_payload(encode_payload([table, figure]))
+    pd.testing.assert_frame_equal(decoded[0], table)
+    assert decoded[1] == {'data': [{'type': 'bar', 'x': ['2021', '2022'], 'y': [0.0, 1.0]}], 'layout': {}}
+
+
+executed = []
+
+
+class _Exploit:
+    def __reduce__(self):
+        return executed.append, ('executado',)
+
+
+def test_shared_cache_never_unpickles(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = ResultCache(max_entries=16, path=path, version=lambda: 'v1')
+    cache.set('chave', {'ok': 1})
+    assert cache.get('chave') == (True, {'ok': 1})
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE resultados SET valor = ?", (pickle.dumps(_Exploit()),))
+    assert cache.get('chave') == (False, None)
+    assert executed == []
@@ -0,0 +1,19 @@
+"""Busca por prefixo de palavra dos dropdowns (PrefixIndex)."""
+import pandas as pd
+
+from app_dash import PrefixIndex
+
+
+def test_search_returns_first_values_in_alphabetical_order():
+    values = pd.Index(['AAREN MEARING', 'ANTONIO MANHÃES', 'BRUNO MOTA', 'MARIA SOUZA', 'ZELIA MACEDO'])
+    index = PrefixIndex(values)
+    # "maria" vem antes de "mearing" nas chaves, mas AAREN MEARING vem antes na lista
+    assert index.search('m', limit=2) == ['AAREN MEARING', 'ANTONIO MANHÃES']
+    assert index.search('M') == list(values)
+    assert index.search('manh') == ['ANTONIO MANHÃES']
+    assert index.search('  ') == []
+
+
+def test_search_lists_each_value_once():
+    index = PrefixIndex(pd.Index(['MARCOS', 'MARIA MARQUES']))
+    assert index.search('mar') == ['MARCOS', 'MARIA MARQUES']
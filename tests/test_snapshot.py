@@ -0,0 +1,38 @@
+"""Publicação do snapshot colunar: a limpeza só remove o que o próprio snapshot criou."""
+import os
+import subprocess
+import sys
+
+import pandas as pd
+
+from app_dash import save_snapshot
+
+
+def _dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def test_save_snapshot_removes_only_its_own_directories(tmp_path):
+    df = pd.DataFrame({'Marca': ['a', 'b'], 'Receita': [1.0, 2.0]})
+    (tmp_path / 'minha_pasta_importante').mkdir()
+    (tmp_path / 'minha_pasta_importante' / 'dados.txt').write_text('x')
+    (tmp_path / 'abcdef').mkdir() # Não é uma versão (16 dígitos hexadecimais)
+    old = save_snapshot(df, {'a.csv': {'sha256': 'antigo'}}, str(tmp_path))
+    stale_tmp = tmp_path / f"{'0' * 16}.tmp-{_dead_pid()}"
+    live_tmp = tmp_path / f"{'1' * 16}.tmp-{os.getppid()}" # Escritor ainda em andamento
+    stale_tmp.mkdir()
+    live_tmp.mkdir()
+
+    version = save_snapshot(df, {'a.csv': {'sha256': 'novo'}}, str(tmp_path))
+    stale_derived = tmp_path / version / f"derivados.tmp-{_dead_pid()}"
+    stale_derived.mkdir()
+    assert save_snapshot(df, {'a.csv': {'sha256': 'novo'}}, str(tmp_path)) == version
+
+    assert (tmp_path / 'minha_pasta_importante' / 'dados.txt').exists()
+    assert (tmp_path / 'abcdef').is_dir()
+    assert not (tmp_path / old).exists()
+    assert (tmp_path / version).is_dir()
+    assert not stale_tmp.exists() and not stale_derived.exists()
+    assert live_tmp.is_dir()